@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.PredictionService import input_dims
+
+async def request(reader, writer, method, path, body=b''):
+    writer.write(('%s %s HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n' %
+                  (method, path, len(body))).encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        key, value = line.decode('latin-1').split(':', 1)
+        if key.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads((await reader.readexactly(length)).decode('utf-8'))
+
+async def runClient(host, port, mode, requests, batch_size, seed, latencies):
+    random_state = np.random.RandomState(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    for _ in range(requests):
+        rows = random_state.rand(batch_size, input_dims[mode]) * 5
+        body = {'input': rows[0].tolist()} if batch_size == 1 else {'inputs': rows.tolist()}
+        start_time = time.perf_counter()
+        status, response = await request(reader, writer, 'POST', '/predict/' + mode, json.dumps(body).encode('utf-8'))
+        latencies.append(time.perf_counter() - start_time)
+        if status != 200:
+            raise RuntimeError('Request failed with %d: %s' % (status, response.get('error')))
+    writer.close()
+
+async def loadTest(host, port, mode, clients, requests, batch_size):
+    latencies = []
+    start_time = time.perf_counter()
+    await asyncio.gather(*[runClient(host, port, mode, requests, batch_size, seed, latencies) for seed in range(clients)])
+    elapsed = time.perf_counter() - start_time
+    reader, writer = await asyncio.open_connection(host, port)
+    status, server_stats = await request(reader, writer, 'GET', '/stats')
+    writer.close()
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+    print('%d clients x %d requests of %d rows in %.2fs: %.0f requests/sec, %.0f rows/sec' %
+          (clients, requests, batch_size, elapsed, len(latencies) / elapsed, len(latencies) * batch_size / elapsed))
+    print('Client latency: p50 %.2fms, p90 %.2fms, p99 %.2fms' % (p50, p90, p99))
+    print('Server stats: ' + json.dumps(server_stats[mode]))
+
+async def waitForService(host, port, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the prediction service on localhost.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--mode', choices=list(input_dims.keys()), default='DoS')
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent connections')
+    parser.add_argument('--requests', type=int, default=200, help='Requests sent by each client')
+    parser.add_argument('--batch-size', type=int, default=1, help='Rows per request')
+    parser.add_argument('--spawn', action='store_true', help='Start the service with the bundled models for the test')
+    args = parser.parse_args(argv)
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    service = None
+    if args.spawn:
+        service = subprocess.Popen([sys.executable, '-m', 'src.PredictionService', '--host', args.host,
+                                    '--port', str(args.port)], cwd=root)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(waitForService(args.host, args.port))
+        loop.run_until_complete(loadTest(args.host, args.port, args.mode, args.clients, args.requests, args.batch_size))
+    finally:
+        loop.close()
+        if service is not None:
+            service.terminate()
+            service.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/python3
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from contextlib import redirect_stdout
+import io
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.CompositionScan import scanSettings, compositionScan
+from src.PredictOutput import predictOutput
+from src.ModelRegistry import modelRegistry
+
+schemas = {
+    'DoS': {'input_dim': 21, 'hidden': 20, 'models': ['DoS'], 'targets': 1},
+    'Mechanical': {'input_dim': 26, 'hidden': 25, 'models': ['elongation', 'tensile', 'yield'], 'targets': 3}
+}
+
+def writeSyntheticModel(model_path, input_dim, hidden, seed, outputs=1):
+    import h5py
+    random_state = np.random.RandomState(seed)
+    shapes = [(input_dim, hidden), (hidden, hidden), (hidden, outputs)]
+    layers = []
+    for index, (fan_in, fan_out) in enumerate(shapes):
+        layer = {'class_name': 'Dense', 'config': {'name': 'dense_%d' % (index + 1), 'units': fan_out,
+                                                   'activation': 'linear' if index == len(shapes) - 1 else 'relu',
+                                                   'use_bias': True}}
+        if index == 0:
+            layer['config']['batch_input_shape'] = [None, input_dim]
+        layers.append(layer)
+        if index < len(shapes) - 1:
+            layers.append({'class_name': 'Dropout', 'config': {'name': 'dropout_%d' % (index + 1), 'rate': 0.2}})
+    config = {'class_name': 'Sequential', 'config': {'name': 'sequential_1', 'layers': layers}}
+    with h5py.File(model_path, 'w') as model_file:
+        model_file.attrs['model_config'] = json.dumps(config).encode('utf-8')
+        model_file.attrs['backend'] = b'tensorflow'
+        weights = model_file.create_group('model_weights')
+        weights.attrs['layer_names'] = [layer['config']['name'].encode('utf-8') for layer in layers]
+        dense_index = 0
+        for layer in layers:
+            name = layer['config']['name']
+            group = weights.create_group(name)
+            if layer['class_name'] != 'Dense':
+                group.attrs['weight_names'] = np.array([], dtype='S1')
+                continue
+            fan_in, fan_out = shapes[dense_index]
+            dense_index += 1
+            limit = np.sqrt(6.0 / (fan_in + fan_out))
+            group.attrs['weight_names'] = [(name + '/kernel:0').encode('utf-8'), (name + '/bias:0').encode('utf-8')]
+            group.create_dataset(name + '/kernel:0', data=random_state.uniform(-limit, limit, (fan_in, fan_out)).astype(np.float32))
+            group.create_dataset(name + '/bias:0', data=np.zeros(fan_out, dtype=np.float32))
+
+def writeSyntheticDataset(dataset_path, input_dim, targets, rows, seed):
+    random_state = np.random.RandomState(seed)
+    data = random_state.rand(rows, input_dim + targets) * 10
+    with open(dataset_path, 'w', newline='') as dataset_file:
+        writer = csv.writer(dataset_file)
+        writer.writerow(['x%d' % index for index in range(input_dim)] + ['y%d' % index for index in range(targets)])
+        np.savetxt(dataset_file, data, fmt='%.4f', delimiter=',')
+
+def timed(function, repeats=1):
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start_time) / repeats
+
+class benchmarkSuite:
+    def __init__(self, workdir, quick=False):
+        self.workdir = workdir
+        self.quick = quick
+        self.model_paths = {}
+        self.results = {}
+
+    def setup(self):
+        for mode, schema in schemas.items():
+            for index, key in enumerate(schema['models']):
+                self.model_paths[key] = os.path.join(self.workdir, key + '_synthetic.h5')
+                writeSyntheticModel(self.model_paths[key], schema['input_dim'], schema['hidden'], index)
+            writeSyntheticDataset(os.path.join(self.workdir, mode + '_prediction.csv'), schema['input_dim'], 0,
+                                  20000 if self.quick else 200000, 1)
+            writeSyntheticDataset(os.path.join(self.workdir, mode + '_training.csv'), schema['input_dim'],
+                                  schema['targets'], 2000 if self.quick else 20000, 2)
+
+    def record(self, name, function):
+        try:
+            self.results[name] = function()
+        except Exception as error:
+            self.results[name] = {'error': '%s: %s' % (type(error).__name__, error)}
+        print('%s: %s' % (name, json.dumps(self.results[name])))
+
+    def benchmarkModelLoad(self):
+        registry = modelRegistry()
+        cold = timed(lambda: registry.load(self.model_paths['DoS']))
+        warm = timed(lambda: registry.load(self.model_paths['DoS']), 100)
+        return {'cold_load_ms': cold * 1000, 'cached_load_ms': warm * 1000}
+
+    def benchmarkColdStart(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        command = [sys.executable, '-c', 'import src.Headless']
+        elapsed = timed(lambda: subprocess.check_call(command, cwd=root), 3)
+        return {'import_headless_s': elapsed}
+
+    def benchmarkScan(self, mode):
+        registry = modelRegistry()
+        models = {key: registry.load(self.model_paths[key]) for key in schemas[mode]['models']}
+        settings = scanSettings(mode)
+        settings.categorical_inputs = {key: list(np.ravel(value)) for key, value in settings.categorical_inputs.items()}
+        for key in list(settings.range_based_inputs.keys())[:6]:
+            settings.range_based_inputs[key] = [0, 2]
+        scan = compositionScan(settings, models, seed=0, cache_size=0)
+        best = scan.generateDatapoint()
+        steps = 20 if self.quick else 200
+        loss, best = scan.calculateStep(best, 0, 'all')
+        step_time = timed(lambda: scan.calculateStep(best, steps // 2, 'all'), steps)
+        keys = [*settings.categorical_inputs.keys(), *settings.range_based_inputs.keys()]
+        finetune_time = timed(lambda: [scan.calculateStep(best, 0, key) for key in keys])
+        return {'step_candidates_per_s': scan.step_batch_size / step_time,
+                'finetune_candidates_per_s': scan.finetune_batch_size * len(keys) / finetune_time}
+
+    def benchmarkPrediction(self, mode):
+        registry = modelRegistry()
+        models = {key: registry.load(self.model_paths[key]) for key in schemas[mode]['models']}
+        dataset_path = os.path.join(self.workdir, mode + '_prediction.csv')
+        output_path = os.path.join(self.workdir, mode + '_predictions.csv')
+        rows = sum(1 for _ in open(dataset_path)) - 1
+        with redirect_stdout(io.StringIO()):
+            elapsed = timed(lambda: predictOutput(dataset_path, models, mode, output_path).run())
+        return {'rows_per_s': rows / elapsed}
+
+    def benchmarkTraining(self):
+        from src.TrainModel import modelTrainer
+        dataset_path = os.path.join(self.workdir, 'DoS_training.csv')
+        load_time = timed(lambda: modelTrainer('DoS', dataset_path=dataset_path, train=False))
+        results = {'load_dataset_s': load_time}
+        try:
+            import keras
+        except ImportError:
+            results['epoch_s'] = None
+            return results
+        trainer = modelTrainer('DoS', verbosity=0, dataset_path=dataset_path, train=False)
+        trainer.activateTestSplit()
+        params = {key: value[0] for key, value in trainer.params.items()}
+        params['epochs'] = 2
+        results['epoch_s'] = timed(lambda: trainer.model(None, None, None, None, params)) / params['epochs']
+        return results
+
+    def run(self):
+        self.setup()
+        self.record('model_load', self.benchmarkModelLoad)
+        self.record('cold_start', self.benchmarkColdStart)
+        for mode in schemas.keys():
+            self.record('scan_' + mode, lambda: self.benchmarkScan(mode))
+            self.record('predict_' + mode, lambda: self.benchmarkPrediction(mode))
+        self.record('training', self.benchmarkTraining)
+        return self.results
+
+def higherIsBetter(metric):
+    return metric.endswith('_per_s')
+
+def compareResults(results, baseline, tolerance):
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            reference = baseline.get(name, {}).get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(reference, (int, float)) or not reference:
+                continue
+            ratio = value / reference if higherIsBetter(metric) else reference / value
+            status = 'REGRESSION' if ratio < 1 - tolerance else 'ok'
+            print('%s.%s: %.4g vs baseline %.4g (%.2fx, %s)' % (name, metric, value, reference, ratio, status))
+            if status != 'ok':
+                regressions.append(name + '.' + metric)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark scans, prediction, model loading and training on synthetic data.')
+    parser.add_argument('--output', default='bench_results.json', help='Where to write the results as JSON')
+    parser.add_argument('--baseline', help='Compare against a results file from an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed slowdown before a metric counts as a regression')
+    parser.add_argument('--quick', action='store_true', help='Use smaller datasets and fewer repeats')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='alloyml_bench_')
+    try:
+        results = benchmarkSuite(workdir, args.quick).run()
+    finally:
+        shutil.rmtree(workdir)
+    report = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+              'timestamp': int(time.time()), 'results': results}
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+    print('Results saved to: ' + args.output)
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_file:
+            regressions = compareResults(results, json.load(baseline_file)['results'], args.tolerance)
+        if regressions:
+            print('Regressions: ' + ', '.join(regressions))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,12 @@
 #!/usr/bin/python3
 
-from copy import deepcopy
+import os
+import time
+import pickle
 import numpy as np
-from scipy.stats import truncnorm
+
+from src.PredictionCache import predictionCache
+from src.Instrumentation import eventEmitter, cancellable, phaseTimer
 
 class AlDatapoint:
     def __init__(self, categorical_inputs, range_based_inputs):
@@ -24,6 +28,149 @@ class AlDatapoint:
     def getAl(self):
         return 100 - sum(self.range_based_inputs.values())
 
+class AlPopulation:
+    def __init__(self, categorical_keys, range_based_keys, categorical_values, range_based_values):
+        self.categorical_keys = list(categorical_keys)
+        self.range_based_keys = list(range_based_keys)
+        self.categorical_values = np.asarray(categorical_values, dtype=float).reshape(-1, len(self.categorical_keys))
+        self.range_based_values = np.asarray(range_based_values, dtype=float).reshape(-1, len(self.range_based_keys))
+
+    def __len__(self):
+        return self.range_based_values.shape[0]
+
+    @classmethod
+    def fromDatapoint(cls, datapoint):
+        return cls(datapoint.categorical_inputs.keys(), datapoint.range_based_inputs.keys(),
+                   [np.mean(value) for value in datapoint.categorical_inputs.values()],
+                   [np.mean(value) for value in datapoint.range_based_inputs.values()])
+
+    def getAl(self):
+        return 100 - self.range_based_values.sum(axis=1)
+
+    def formatForInput(self):
+        return np.column_stack([self.categorical_values, self.getAl(), self.range_based_values])
+
+    def repeat(self, size, index=0):
+        return AlPopulation(self.categorical_keys, self.range_based_keys,
+                            np.repeat(self.categorical_values[index:index+1], size, axis=0),
+                            np.repeat(self.range_based_values[index:index+1], size, axis=0))
+
+    def select(self, index):
+        return AlPopulation(self.categorical_keys, self.range_based_keys,
+                            self.categorical_values[index], self.range_based_values[index])
+
+    def getDatapoint(self, index=0):
+        categorical_inputs = dict(zip(self.categorical_keys,
+                                      [int(value) if value.is_integer() else value
+                                       for value in self.categorical_values[index].tolist()]))
+        range_based_inputs = dict(zip(self.range_based_keys, self.range_based_values[index].tolist()))
+        return AlDatapoint(categorical_inputs, range_based_inputs)
+
+model_outputs = {
+    'DoS': {
+        'DoS': ('DoS', 0)
+    },
+    'Mechanical': {
+        'elongation%': ('elongation', 0),
+        'tensile strength(MPa)': ('tensile', 0),
+        'yield strength(MPa)': ('yield', 0)
+    }
+}
+
+multi_output_models = {
+    'Mechanical': ('mechanical', ['elongation%', 'tensile strength(MPa)', 'yield strength(MPa)'])
+}
+
+def getModelOutputs(mode, models):
+    if mode in multi_output_models and multi_output_models[mode][0] in models:
+        model_key, properties = multi_output_models[mode]
+        return {key: (model_key, column) for column, key in enumerate(properties)}
+    return model_outputs[mode]
+
+class lossEngine:
+    def __init__(self, models, mode, targets, loss_type, cache=None, uncertainty_weight=0.0, return_std=False):
+        self.models = models
+        self.cache = cache
+        self.outputs = getModelOutputs(mode, models)
+        self.targets = targets
+        self.loss_type = loss_type
+        self.uncertainty_weight = uncertainty_weight
+        self.return_std = return_std or bool(uncertainty_weight)
+
+    def hasStd(self, key):
+        return self.return_std and hasattr(self.models[self.outputs[key][0]], 'predictDistribution')
+
+    def predictModel(self, model_key, inputs):
+        model = self.models[model_key]
+        options = {}
+        if self.return_std and hasattr(model, 'predictDistribution'):
+            options['return_std'] = True
+            model_key = model_key + '/std'
+        if self.cache is not None:
+            return self.cache.predict(model_key, model, inputs, **options)
+        return np.reshape(model.predict(inputs, batch_size=inputs.shape[0], **options), (inputs.shape[0], -1))
+
+    def predict(self, inputs, properties=None):
+        if properties is None:
+            properties = self.outputs.keys()
+        inputs = np.asarray(inputs, dtype=float)
+        predictions = {}
+        results = {}
+        for key in properties:
+            model_key, column = self.outputs[key]
+            if model_key not in predictions:
+                predictions[model_key] = self.predictModel(model_key, inputs)
+            results[key] = predictions[model_key][:, column]
+            if self.hasStd(key):
+                results[key + ' std'] = predictions[model_key][:, predictions[model_key].shape[1] // 2 + column]
+        return results
+
+    def calculateLoss(self, predictions):
+        loss = 0
+        for key, target in self.targets.items():
+            if self.loss_type == 'Linear':
+                loss = loss + abs(predictions[key] - target)
+            elif self.loss_type == 'Percentage':
+                loss = loss + abs((predictions[key] / target) - 1) * 100
+            if self.uncertainty_weight and key + ' std' in predictions:
+                if self.loss_type == 'Linear':
+                    loss = loss + self.uncertainty_weight * predictions[key + ' std']
+                elif self.loss_type == 'Percentage':
+                    loss = loss + self.uncertainty_weight * predictions[key + ' std'] / abs(target) * 100
+        return loss / len(self.targets)
+
+    def evaluate(self, inputs):
+        predictions = self.predict(inputs, self.targets.keys())
+        return self.calculateLoss(predictions), predictions
+
+    def gradient(self, inputs):
+        inputs = np.asarray(inputs, dtype=float)
+        predictions = {}
+        loss = 0
+        gradient = np.zeros(inputs.shape)
+        for key, target in self.targets.items():
+            model_key, column = self.outputs[key]
+            if model_key not in predictions:
+                if not hasattr(self.models[model_key], 'inputGradient'):
+                    raise ValueError('Model %s does not provide input gradients, load it with the NumPy backend' % model_key)
+                if self.uncertainty_weight and self.hasStd(key):
+                    predictions[model_key] = self.models[model_key].inputGradient(inputs, return_std=True)
+                else:
+                    predictions[model_key] = self.models[model_key].inputGradient(inputs)
+            outputs, jacobian = predictions[model_key][:2]
+            if self.loss_type == 'Linear':
+                loss = loss + abs(outputs[:, column] - target)
+                gradient += np.sign(outputs[:, column] - target)[:, np.newaxis] * jacobian[:, column, :]
+            elif self.loss_type == 'Percentage':
+                loss = loss + abs((outputs[:, column] / target) - 1) * 100
+                gradient += (np.sign((outputs[:, column] / target) - 1) * 100 / target)[:, np.newaxis] * jacobian[:, column, :]
+            if len(predictions[model_key]) == 4:
+                std, std_jacobian = predictions[model_key][2:]
+                scale = self.uncertainty_weight if self.loss_type == 'Linear' else self.uncertainty_weight / abs(target) * 100
+                loss = loss + scale * std[:, column]
+                gradient += scale * std_jacobian[:, column, :]
+        return loss / len(self.targets), gradient / len(self.targets)
+
 class scanSettings:
     def __init__(self, mode):
         self.mode = mode
@@ -62,8 +209,8 @@ class scanSettings:
                  [0, 0], [0, 0], [0, 0], [0, 0], [4, 5.5], [0, 0], [0, 0], [0, 0], [0, 0],
                  [0, 0], [0, 0], [0, 0], [0, 0], [0, 0], [0, 0]]))
 
-class compositionScan:
-    def __init__(self, settings, models):
+class compositionScan(eventEmitter, cancellable):
+    def __init__(self, settings, models, seed=None, cache_size=50000, strategy=None, store=None):
         self.step_batch_size = 50
         self.step_final_std = 0.01
         self.finetune_max_rounds = 10
@@ -75,72 +222,230 @@ class compositionScan:
         self.categorical_inputs = settings.categorical_inputs
         self.range_based_inputs = settings.range_based_inputs
         self.models = models
+        self.store = store
+        self.cache = predictionCache(cache_size, backend=store) if cache_size else store
+        self.uncertainty_weight = getattr(settings, 'uncertainty_weight', 0.0)
+        self.loss_engine = lossEngine(self.models, self.mode, self.targets, self.loss_type, self.cache,
+                                      self.uncertainty_weight, return_std=True)
+        self.random_state = np.random.RandomState(seed)
+        self.strategy = strategy
+        self.evaluations = 0
+        self.loss_history = []
+        self.phase = None
+        self.timer = phaseTimer()
+        self.callbacks = []
+        self.early_stop_loss = getattr(settings, 'early_stop_loss', None)
+        self.early_stop_patience = getattr(settings, 'early_stop_patience', None)
+        self.early_stop_tolerance = getattr(settings, 'early_stop_tolerance', 0.0)
+        self.checkpoint_path = None
+        self.checkpoint_interval = 50
+        self.resume_state = None
+        self.cancel_event = None
 
     def generateDatapoint(self):
         if self.mode == 'DoS' or self.mode == 'Mechanical':
-            return AlDatapoint(self.categorical_inputs, self.range_based_inputs)
+            return AlPopulation.fromDatapoint(AlDatapoint(self.categorical_inputs, self.range_based_inputs))
 
-    def calculateLoss(self, datapoint):
-        if self.mode == 'DoS':
-            return abs(self.models['DoS'].predict(datapoint.formatForInput())[0] - self.targets['DoS'])
-        elif self.mode == 'Mechanical':
-            return ((abs((self.models['elongation'].predict(datapoint.formatForInput())[0]/self.targets['elongation%'])-1)*100 \
-                   + abs((self.models['yield'].predict(datapoint.formatForInput())[0]/self.targets['yield strength(MPa)'])-1)*100))/2
+    def calculateLoss(self, population):
+        start_time = time.perf_counter()
+        predictions = self.loss_engine.predict(population.formatForInput(), self.targets.keys())
+        inference_time = time.perf_counter()
+        loss = self.loss_engine.calculateLoss(predictions)
+        self.timer.add('inference_time', inference_time - start_time)
+        self.timer.add('loss_time', time.perf_counter() - inference_time)
+        self.recordEvaluations(loss)
+        return loss
+
+    def recordEvaluations(self, loss):
+        self.evaluations += len(loss)
+        if not self.loss_history or loss.min() < self.loss_history[-1][1]:
+            self.loss_history.append((self.evaluations, float(loss.min())))
+
+    def evaluationsToLoss(self, target_loss):
+        for evaluations, loss in self.loss_history:
+            if loss <= target_loss:
+                return evaluations
+        return None
 
     def printResults(self, best_datapoint):
         best_datapoint.print()
+        predictions = self.loss_engine.predict(best_datapoint.formatForInput())
         if self.mode == 'DoS':
-            print('Results in a predicted %f DoS' % (self.models['DoS'].predict(best_datapoint.formatForInput())[0]))
+            print('Results in a predicted %f DoS%s' % (predictions['DoS'][0], self.formatStd(predictions, 'DoS')))
         elif self.mode == 'Mechanical':
-            print('Results in a predicted %f elongation(%%)' % (self.models['elongation'].predict(best_datapoint.formatForInput())[0]))
-            print('Results in a predicted %f tensile strength(MPa)' % (self.models['tensile'].predict(best_datapoint.formatForInput())[0]))
-            print('Results in a predicted %f yield strength(MPa)' % (self.models['yield'].predict(best_datapoint.formatForInput())[0]))
+            print('Results in a predicted %f elongation(%%)%s' %
+                  (predictions['elongation%'][0], self.formatStd(predictions, 'elongation%')))
+            print('Results in a predicted %f tensile strength(MPa)%s' %
+                  (predictions['tensile strength(MPa)'][0], self.formatStd(predictions, 'tensile strength(MPa)')))
+            print('Results in a predicted %f yield strength(MPa)%s' %
+                  (predictions['yield strength(MPa)'][0], self.formatStd(predictions, 'yield strength(MPa)')))
+
+    def formatStd(self, predictions, key):
+        if key + ' std' not in predictions:
+            return ''
+        return ' (+/- %f)' % predictions[key + ' std'][0]
+
+    def setPhase(self, phase):
+        self.phase = phase
+        if self.cache is not None:
+            self.cache.setPhase(phase)
 
     def run(self):
-        best_loss = None
-        best_datapoint = self.generateDatapoint()
-        for i in range(self.max_steps):
-            loss, datapoint = self.calculateStep(best_datapoint, i, 'all')
-            if best_loss is None or loss < best_loss:
-                best_datapoint = datapoint
-                best_loss = loss
-                print('[Step %d] Best %s Loss = %f.' % (i, self.loss_type, best_loss))
-        for i in range(self.finetune_max_rounds):
-            pre_tune_loss = best_loss
-            for key in [*self.categorical_inputs.keys(), *self.range_based_inputs.keys()]:
-                loss, datapoint = self.calculateStep(best_datapoint, i, key)
-                if loss < best_loss:
-                    best_datapoint = datapoint
-                    best_loss = loss
-            if best_loss < pre_tune_loss:
-                print('[Finetune] Best %s Loss = %f.' % (self.loss_type, best_loss))
-            else:
-                break
+        best_loss, best_datapoint = self.search()
         print('==========Scan Finished==========')
-        self.printResults(best_datapoint)
+        self.setPhase('results')
+        self.printResults(best_datapoint.getDatapoint())
+        if self.cache is not None:
+            self.cache.printStats()
+        return best_loss, best_datapoint
+
+    def search(self):
+        self.emit('start', mode=self.mode, max_steps=self.max_steps,
+                  strategy=type(self.strategy).__name__ if self.strategy is not None else 'randomWalk')
+        if self.strategy is not None:
+            self.setPhase('search')
+            best_loss, best_datapoint = self.strategy.search(self)
+        else:
+            best_loss, best_datapoint = self.randomWalk()
+        self.emit('finish', best_loss=float(best_loss), evaluations=self.evaluations, **self.timer.totals)
+        return best_loss, best_datapoint
 
+    def emitProgress(self, event, best_loss, evaluated, **data):
+        if self.callbacks:
+            self.emit(event, phase=self.phase, best_loss=float(best_loss), evaluated=evaluated,
+                      evaluations=self.evaluations, **dict(data, **self.timer.delta()))
+
+    def getCheckpointKey(self):
+        return {'mode': self.mode, 'loss_type': self.loss_type, 'targets': dict(self.targets), 'max_steps': self.max_steps,
+                'categorical_inputs': dict(self.categorical_inputs), 'range_based_inputs': dict(self.range_based_inputs)}
+
+    def saveCheckpoint(self, phase, step, best_loss, best_datapoint, no_improvement):
+        if self.checkpoint_path is None:
+            return
+        state = {'key': self.getCheckpointKey(), 'phase': phase, 'step': step, 'best_loss': best_loss,
+                 'best_datapoint': best_datapoint, 'no_improvement': no_improvement,
+                 'random_state': self.random_state.get_state(), 'evaluations': self.evaluations,
+                 'loss_history': list(self.loss_history)}
+        temporary_path = self.checkpoint_path + '.tmp'
+        with open(temporary_path, 'wb') as checkpoint_file:
+            pickle.dump(state, checkpoint_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, self.checkpoint_path)
+        self.emit('checkpoint', phase=phase, step=step, path=self.checkpoint_path)
+
+    def loadCheckpoint(self, checkpoint_path):
+        with open(checkpoint_path, 'rb') as checkpoint_file:
+            state = pickle.load(checkpoint_file)
+        if state['key'] != self.getCheckpointKey():
+            raise ValueError('Checkpoint %s was saved by a scan with different settings' % checkpoint_path)
+        self.random_state.set_state(state['random_state'])
+        self.evaluations = state['evaluations']
+        self.loss_history = state['loss_history']
+        self.resume_state = state
+        print('[Resume] Continuing %s phase from step %d with best %s Loss = %f.' %
+              (state['phase'], state['step'], self.loss_type, state['best_loss']))
+
+    def checkConvergence(self, best_loss, no_improvement):
+        if self.early_stop_loss is not None and best_loss <= self.early_stop_loss:
+            return 'target loss reached'
+        if self.early_stop_patience is not None and no_improvement >= self.early_stop_patience:
+            return 'no improvement for %d steps' % no_improvement
+        return None
+
+    def randomWalk(self):
+        state = self.resume_state
+        self.resume_state = None
+        if state is None:
+            state = {'phase': 'step', 'step': 0, 'best_loss': None, 'best_datapoint': self.generateDatapoint(),
+                     'no_improvement': 0}
+            warm_start = []
+            if self.store is not None:
+                self.setPhase('warm_start')
+                warm_start = self.store.queryBest(self)
+            if warm_start:
+                state['best_loss'], state['best_datapoint'] = warm_start[0]
+                print('[Warm start] Best stored %s Loss = %f.' % (self.loss_type, state['best_loss']))
+        best_loss = state['best_loss']
+        best_datapoint = state['best_datapoint']
+        no_improvement = state['no_improvement']
+        if state['phase'] == 'step':
+            self.setPhase('step')
+            for i in range(state['step'], self.max_steps):
+                self.checkCancelled()
+                loss, datapoint = self.calculateStep(best_datapoint, i, 'all')
+                if best_loss is None or loss < best_loss:
+                    if best_loss is None or best_loss - loss > self.early_stop_tolerance:
+                        no_improvement = 0
+                    else:
+                        no_improvement += 1
+                    best_datapoint = datapoint
+                    best_loss = loss
+                    print('[Step %d] Best %s Loss = %f.' % (i, self.loss_type, best_loss))
+                else:
+                    no_improvement += 1
+                self.emitProgress('step', best_loss, self.step_batch_size, step=i, max_steps=self.max_steps,
+                                  std=self.step_final_std * (self.max_steps / float(i + 1)))
+                reason = self.checkConvergence(best_loss, no_improvement)
+                if reason is not None:
+                    print('[Step %d] Stopping early: %s.' % (i, reason))
+                    self.emit('early_stop', phase='step', step=i, reason=reason, best_loss=float(best_loss))
+                    break
+                if (i + 1) % self.checkpoint_interval == 0:
+                    self.saveCheckpoint('step', i + 1, best_loss, best_datapoint, no_improvement)
+            state = {'phase': 'finetune', 'step': 0}
+            self.saveCheckpoint('finetune', 0, best_loss, best_datapoint, no_improvement)
+        if state['phase'] == 'finetune':
+            self.setPhase('finetune')
+            for i in range(state['step'], self.finetune_max_rounds):
+                self.checkCancelled()
+                pre_tune_loss = best_loss
+                keys = [*self.categorical_inputs.keys(), *self.range_based_inputs.keys()]
+                for key in keys:
+                    loss, datapoint = self.calculateStep(best_datapoint, i, key)
+                    if loss < best_loss:
+                        best_datapoint = datapoint
+                        best_loss = loss
+                self.emitProgress('finetune', best_loss, self.finetune_batch_size * len(keys), step=i,
+                                  max_steps=self.finetune_max_rounds,
+                                  std=self.step_final_std * (self.max_steps / float(i + 1)))
+                if best_loss < pre_tune_loss:
+                    print('[Finetune] Best %s Loss = %f.' % (self.loss_type, best_loss))
+                    self.saveCheckpoint('finetune', i + 1, best_loss, best_datapoint, no_improvement)
+                else:
+                    break
+            self.saveCheckpoint('finished', 0, best_loss, best_datapoint, no_improvement)
+        return best_loss, best_datapoint
 
     def calculateStep(self, best_datapoint, step_number, target_var):
         if target_var == 'all':
             batch_size = self.step_batch_size
         else:
             batch_size = self.finetune_batch_size
-        loss = [0] * batch_size
-        datapoints = []
+        start_time = time.perf_counter()
         std = self.step_final_std * (self.max_steps / float(step_number + 1))
-        for i in range(batch_size):
-            datapoints.append(deepcopy(best_datapoint))
-            for key in self.categorical_inputs.keys():
-                if target_var == key or target_var == 'all':
-                    datapoints[i].categorical_inputs[key] = np.random.choice(self.categorical_inputs[key])
-            for key in self.range_based_inputs.keys():
-                if target_var == key or target_var == 'all':
-                    if max(self.range_based_inputs[key]) != min(self.range_based_inputs[key]):
-                        a = (min(self.range_based_inputs[key])-np.mean(best_datapoint.range_based_inputs[key]))/std
-                        b = (max(self.range_based_inputs[key])-np.mean(best_datapoint.range_based_inputs[key]))/std
-                        datapoints[i].range_based_inputs[key] = round(
-                         float(truncnorm.rvs(a, b, loc=np.mean(best_datapoint.range_based_inputs[key]), scale=std)), 2)
-                    else:
-                        datapoints[i].range_based_inputs[key] = min(self.range_based_inputs[key])
-            loss[i] = self.calculateLoss(datapoints[i])
-        return min(loss), datapoints[loss.index(min(loss))]
\ No newline at end of file
+        candidates = best_datapoint.repeat(batch_size)
+        for index, key in enumerate(self.categorical_inputs.keys()):
+            if target_var == key or target_var == 'all':
+                candidates.categorical_values[:, index] = self.random_state.choice(np.ravel(self.categorical_inputs[key]), batch_size)
+        columns = [index for index, key in enumerate(self.range_based_inputs.keys()) if target_var == key or target_var == 'all']
+        if columns:
+            candidates.range_based_values[:, columns] = self.sampleRanges(best_datapoint.range_based_values[0, columns],
+                                                                          columns, std, batch_size)
+        self.timer.add('sampling_time', time.perf_counter() - start_time)
+        loss = self.calculateLoss(candidates)
+        index = int(np.argmin(loss))
+        return loss[index], candidates.select(index)
+
+    def sampleRanges(self, centre, columns, std, batch_size):
+        from scipy.stats import truncnorm
+        bounds = np.asarray(list(self.range_based_inputs.values()), dtype=float)[columns]
+        lower = bounds.min(axis=1)
+        upper = bounds.max(axis=1)
+        samples = np.repeat(lower[np.newaxis, :], batch_size, axis=0)
+        varied = upper != lower
+        if varied.any():
+            a = (lower[varied] - centre[varied]) / std
+            b = (upper[varied] - centre[varied]) / std
+            samples[:, varied] = np.round(truncnorm.rvs(a, b, loc=centre[varied], scale=std,
+                                                        size=(batch_size, int(varied.sum())),
+                                                        random_state=self.random_state), 2)
+        return samples
@@ -0,0 +1,190 @@
+#!/usr/bin/python3
+import os
+import json
+import time
+import shutil
+import numpy as np
+
+from src.CompositionScan import AlPopulation, lossEngine
+from src.PredictionCache import predictionCache
+from src.Optimizers import searchSpace
+
+class storeNamespace:
+    def __init__(self, path):
+        self.path = path
+        self.rows = {}
+        self.size = 0
+        self.inputs = None
+        self.outputs = None
+        self.pending = []
+        self.tree = None
+        self.tree_size = 0
+        self.chunks_written = 0
+        if os.path.isdir(self.path):
+            for name in sorted(os.listdir(self.path)):
+                if name.endswith('.npz'):
+                    with np.load(os.path.join(self.path, name)) as chunk:
+                        self.add(chunk['inputs'], chunk['outputs'])
+
+    def add(self, inputs, outputs):
+        inputs = np.asarray(inputs, dtype=float) + 0.0
+        outputs = np.asarray(outputs, dtype=np.float32).reshape(inputs.shape[0], -1)
+        if self.inputs is None:
+            self.inputs = np.zeros((max(inputs.shape[0], 1024), inputs.shape[1]))
+            self.outputs = np.zeros((self.inputs.shape[0], outputs.shape[1]), dtype=np.float32)
+        elif self.size + inputs.shape[0] > self.inputs.shape[0]:
+            capacity = max(2 * self.inputs.shape[0], self.size + inputs.shape[0])
+            self.inputs = np.vstack([self.inputs[:self.size], np.zeros((capacity - self.size, self.inputs.shape[1]))])
+            self.outputs = np.vstack([self.outputs[:self.size],
+                                      np.zeros((capacity - self.size, self.outputs.shape[1]), dtype=np.float32)])
+        self.inputs[self.size:self.size + inputs.shape[0]] = inputs
+        self.outputs[self.size:self.size + inputs.shape[0]] = outputs
+        for index, row in enumerate(inputs):
+            self.rows.setdefault(row.tobytes(), self.size + index)
+        self.size += inputs.shape[0]
+
+    def append(self, inputs, outputs):
+        self.pending.append((self.size, self.size + inputs.shape[0]))
+        self.add(inputs, outputs)
+
+    def find(self, inputs):
+        return np.fromiter((self.rows.get(row.tobytes(), -1) for row in inputs), dtype=np.int64, count=inputs.shape[0])
+
+    def flush(self):
+        if not self.pending:
+            return 0
+        start, stop = self.pending[0][0], self.pending[-1][1]
+        os.makedirs(self.path, exist_ok=True)
+        name = 'chunk_%d_%d_%d.npz' % (int(time.time() * 1000), os.getpid(), self.chunks_written)
+        temporary_path = os.path.join(self.path, name + '.tmp')
+        with open(temporary_path, 'wb') as chunk_file:
+            np.savez(chunk_file, inputs=self.inputs[start:stop], outputs=self.outputs[start:stop])
+        os.replace(temporary_path, os.path.join(self.path, name))
+        self.chunks_written += 1
+        self.pending = []
+        return stop - start
+
+    def queryBox(self, lower, upper):
+        if self.size == 0:
+            return np.zeros(0, dtype=int)
+        inputs = self.inputs[:self.size]
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError:
+            candidates = np.arange(self.size)
+        else:
+            if self.tree is None or self.tree_size != self.size:
+                self.tree = cKDTree(inputs)
+                self.tree_size = self.size
+            radius = float(np.max(upper - lower)) / 2 + 1e-9
+            candidates = np.asarray(self.tree.query_ball_point((lower + upper) / 2, radius, p=np.inf), dtype=int)
+        inside = np.all((inputs[candidates] >= lower - 1e-9) & (inputs[candidates] <= upper + 1e-9), axis=1)
+        return candidates[inside]
+
+class evaluationStore(predictionCache):
+    def __init__(self, directory='evaluation_store', identities=None, chunk_rows=4096, decimals=4):
+        super().__init__(0, decimals)
+        self.directory = directory
+        self.identities = identities or {}
+        self.chunk_rows = chunk_rows
+        self.namespaces = {}
+        self.pending_rows = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self.invalidateChanged()
+
+    def quantize(self, inputs):
+        if self.decimals is None:
+            return np.asarray(inputs, dtype=float) + 0.0
+        return np.round(np.asarray(inputs, dtype=float), self.decimals) + 0.0
+
+    def getNamespacePath(self, model_key, identity):
+        return os.path.join(self.directory, '%s_%s' % (model_key.replace('/', '_'), identity))
+
+    def invalidateChanged(self):
+        index_path = os.path.join(self.directory, 'models.json')
+        index = {}
+        if os.path.exists(index_path):
+            with open(index_path, 'r') as index_file:
+                index = json.load(index_file)
+        for model_key, (model_path, identity) in self.identities.items():
+            model_path = os.path.abspath(model_path) if isinstance(model_path, str) else \
+                [os.path.abspath(path) for path in model_path]
+            previous = index.get(model_key)
+            if previous is not None and previous['path'] == model_path and previous['identity'] != identity:
+                for suffix in ['', '/std']:
+                    stale_path = self.getNamespacePath(model_key + suffix, previous['identity'])
+                    if os.path.isdir(stale_path):
+                        shutil.rmtree(stale_path)
+                print('[Store] %s changed since the last session, dropped its stored evaluations' % model_key)
+            index[model_key] = {'path': model_path, 'identity': identity}
+        with open(index_path + '.tmp', 'w') as index_file:
+            json.dump(index, index_file, indent=1)
+        os.replace(index_path + '.tmp', index_path)
+
+    def getNamespace(self, model_key):
+        base_key = model_key.split('/')[0]
+        if base_key not in self.identities:
+            return None
+        if model_key not in self.namespaces:
+            self.namespaces[model_key] = storeNamespace(self.getNamespacePath(model_key, self.identities[base_key][1]))
+        return self.namespaces[model_key]
+
+    def predict(self, model_key, model, inputs, **options):
+        namespace = self.getNamespace(model_key)
+        if namespace is None:
+            return np.reshape(model.predict(inputs, batch_size=inputs.shape[0], **options), (inputs.shape[0], -1))
+        quantized = self.quantize(inputs)
+        indices = namespace.find(quantized)
+        missing = np.flatnonzero(indices < 0)
+        evaluated = 0
+        if len(missing):
+            unique_rows = np.unique(quantized[missing], axis=0)
+            predicted = model.predict(unique_rows, batch_size=unique_rows.shape[0], **options)
+            namespace.append(unique_rows, predicted)
+            indices[missing] = namespace.find(quantized[missing])
+            evaluated = unique_rows.shape[0]
+            self.pending_rows += evaluated
+            if self.pending_rows >= self.chunk_rows:
+                self.flush()
+        self.record(quantized.shape[0] - evaluated, evaluated)
+        return namespace.outputs[indices]
+
+    def queryBest(self, scan, count=1, limit=100000):
+        space = searchSpace(scan)
+        lower = np.concatenate([[options.min() for options in space.categorical_options], [100 - space.upper.sum()],
+                                space.lower])
+        upper = np.concatenate([[options.max() for options in space.categorical_options], [100 - space.lower.sum()],
+                                space.upper])
+        rows = []
+        for model_key in set(scan.loss_engine.outputs[key][0] for key in scan.targets):
+            for suffix in ['', '/std']:
+                namespace = self.getNamespace(model_key + suffix)
+                if namespace is not None and namespace.size and namespace.inputs.shape[1] == len(lower):
+                    rows.append(namespace.inputs[namespace.queryBox(lower, upper)])
+        if not rows:
+            return []
+        inputs = np.unique(np.vstack(rows), axis=0)
+        for column, options in enumerate(space.categorical_options):
+            inputs = inputs[np.isin(inputs[:, column], options)]
+        inputs = inputs[:limit]
+        if inputs.shape[0] == 0:
+            return []
+        loss = lossEngine(scan.models, scan.mode, scan.targets, scan.loss_type, self, scan.uncertainty_weight,
+                          return_std=True).evaluate(inputs)[0]
+        columns = len(space.categorical_keys)
+        population = AlPopulation(space.categorical_keys, space.range_based_keys, inputs[:, :columns],
+                                  inputs[:, columns + 1:])
+        return [(loss[index], population.select(index)) for index in np.argsort(loss, kind='stable')[:count]]
+
+    def flush(self):
+        written = sum(namespace.flush() for namespace in self.namespaces.values())
+        self.pending_rows = 0
+        return written
+
+    def close(self):
+        self.flush()
+
+    def printStats(self):
+        for phase, (hits, misses) in self.stats.items():
+            print('[Store] %s: %.1f%% served from %s (%d stored, %d model evaluations)' %
+                  (phase, 100 * hits / float(max(hits + misses, 1)), self.directory, hits, misses))
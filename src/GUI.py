@@ -2,43 +2,55 @@
 import os
 import sys
 import re
+import queue
 import pickle
 import threading
 import shutil
+import traceback
 import tkinter as tk
 from tkinter import messagebox, Button, Label, Grid, Text, END, N, S, E, W, BOTH, LEFT, ttk, PhotoImage
 import tkinter.filedialog as filedialog
-from tensorflow import keras
 
 
 from src.PredictOutput import predictOutput
 from src.CompositionScan import scanSettings, compositionScan
+from src.ModelRegistry import registry
+from src.JobManager import jobManager
+from src.Instrumentation import jobCancelled
 
 model_paths = {}
+jobs = None
 
-def get_models():
-    models = {}
-    global models_paths
-    for key, value in model_paths.items():
-        models[key] = keras.models.load_model(value, compile=False)
-    return models
+def get_models(mode=None):
+    return registry.getModels(model_paths, mode)
 
 class textRedirector:
-    def __init__(self, widget, tag="stdout"):
-        self.widget = widget
+    def __init__(self, fallback, tag="stdout"):
+        self.fallback = fallback
         self.tag = tag
+        self.consoles = {}
+        self.encoding = getattr(fallback, 'encoding', None) or 'utf-8'
+
+    def attach(self, console):
+        self.consoles[threading.get_ident()] = console
+
+    def detach(self):
+        self.consoles.pop(threading.get_ident(), None)
 
     def write(self, text):
-        self.widget.configure(state="normal")
-        self.widget.insert("end", text, (self.tag,))
-        self.widget.see(tk.END)
-        self.widget.configure(state="disabled")
+        console = self.consoles.get(threading.get_ident())
+        if console is None:
+            if self.fallback is not None:
+                self.fallback.write(text)
+        elif not console.closed:
+            console.messages.put((self.tag, text))
 
     def flush(self):
-        self.widget.configure(state="normal")
-        self.widget.insert("end", '\n', (self.tag,))
-        self.widget.see(tk.END)
-        self.widget.configure(state="disabled")
+        if self.fallback is not None:
+            self.fallback.flush()
+
+    def isatty(self):
+        return False
 
 class sterileText(tk.Text):
     def __init__(self, *args, **kwargs):
@@ -84,17 +96,127 @@ class scrollFrame(tk.Frame):
         self.canvas.configure(scrollregion=self.canvas.bbox('all'))
 
 class consoleWindow:
-    def __init__(self, master):
+    def __init__(self, master, title='AlloyML Console', max_lines=5000, drain_interval=50, drain_limit=10000):
+        self.max_lines = max_lines
+        self.drain_interval = drain_interval
+        self.drain_limit = drain_limit
+        self.messages = queue.Queue()
+        self.closed = False
         self.frame = tk.Toplevel(master)
         self.frame.iconbitmap('graphics/AlloyML.ico')
-        self.frame.title('AlloyML Console')
-        self.text = tk.Text(self.frame)
+        self.frame.title(title)
+        self.status = Label(self.frame, anchor='w')
+        self.status.pack(side='bottom', fill='x')
+        self.progress = ttk.Progressbar(self.frame, orient='horizontal', mode='determinate', maximum=1.0)
+        self.progress.pack(side='bottom', fill='x')
+        self.text = tk.Text(self.frame, state='disabled')
         self.scrollbar = tk.Scrollbar(self.frame, command=self.text.yview)
         self.scrollbar.pack(side='right', fill='y')
         self.text['yscrollcommand'] = self.scrollbar.set
         self.text.pack(fill='both', expand=True)
-        sys.stdout = textRedirector(self.text, "stdout")
-        sys.stderr = textRedirector(self.text, "stderr")
+        self.frame.bind('<Destroy>', self.close)
+        self.frame.after(self.drain_interval, self.drain)
+
+    def trackProgress(self, event):
+        if event['event'] in ['step', 'gradient_step']:
+            self.messages.put(('progress', ((event['step'] + 1) / float(event['max_steps']),
+                                            '%s %d of %d' % (event['phase'], event['step'] + 1, event['max_steps']))))
+        elif event['event'] == 'evaluation':
+            self.messages.put(('progress', (event['evaluations'] / float(event['max_evaluations']),
+                                            '%d of %d evaluations' % (event['evaluations'], event['max_evaluations']))))
+        elif event['event'] == 'finetune':
+            self.messages.put(('progress', (1.0, 'finetune round %d' % (event['step'] + 1))))
+        elif event['event'] == 'row':
+            self.messages.put(('progress', (event['rows'] / float(event['total_rows']),
+                                            'row %d of %d' % (event['rows'], event['total_rows']))))
+        elif event['event'] == 'finish':
+            self.messages.put(('progress', (1.0, 'finished')))
+
+    def drain(self):
+        if self.closed:
+            return
+        chunks = []
+        progress = None
+        for _ in range(self.drain_limit):
+            try:
+                tag, text = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if tag == 'progress':
+                progress = text
+            elif chunks and chunks[-1][0] == tag:
+                chunks[-1][1].append(text)
+            else:
+                chunks.append((tag, [text]))
+        if chunks:
+            self.text.configure(state='normal')
+            for tag, texts in chunks:
+                self.text.insert('end', ''.join(texts), (tag,))
+            excess = int(self.text.index('end-1c').split('.')[0]) - self.max_lines
+            if excess > 0:
+                self.text.delete('1.0', '%d.0' % (excess + 1))
+            self.text.see(tk.END)
+            self.text.configure(state='disabled')
+        if progress is not None:
+            self.progress['value'] = min(progress[0], 1.0)
+            self.status['text'] = progress[1]
+        self.frame.after(self.drain_interval, self.drain)
+
+    def attach(self):
+        for stream in [sys.stdout, sys.stderr]:
+            if isinstance(stream, textRedirector):
+                stream.attach(self)
+
+    def detach(self):
+        for stream in [sys.stdout, sys.stderr]:
+            if isinstance(stream, textRedirector):
+                stream.detach()
+
+    def close(self, event=None):
+        if event is not None and event.widget is not self.frame:
+            return
+        self.closed = True
+
+class jobsWindow:
+    def __init__(self, master, refresh_interval=500):
+        self.refresh_interval = refresh_interval
+        self.frame = tk.Toplevel(master)
+        self.frame.iconbitmap('graphics/AlloyML.ico')
+        self.frame.title('AlloyML Jobs (%d at a time)' % jobs.max_workers)
+        columns = ['name', 'status', 'elapsed', 'result']
+        self.table = ttk.Treeview(self.frame, columns=columns, show='headings', height=10)
+        for column in columns:
+            self.table.heading(column, text=column.capitalize())
+        self.table.pack(fill='both', expand=True)
+        Button(self.frame, text='Cancel Selected', command=self.cancelSelected).pack(side='left', fill='x', expand=True)
+        Button(self.frame, text='Cancel All', command=self.cancelAll).pack(side='left', fill='x', expand=True)
+        self.refresh()
+
+    def cancelSelected(self):
+        for item in self.table.selection():
+            jobs.cancel(int(item))
+
+    def cancelAll(self):
+        for current_job in jobs.getActive():
+            current_job.cancel()
+
+    def refresh(self):
+        if not self.frame.winfo_exists():
+            return
+        for current_job in jobs.getJobs():
+            if current_job.error is not None:
+                result = current_job.error
+            elif isinstance(current_job.result, float):
+                result = 'best loss %f' % current_job.result
+            else:
+                result = '' if current_job.result is None else str(current_job.result)
+            values = (current_job.name, current_job.status, '%.1fs' % current_job.getElapsed(), result)
+            item = str(current_job.job_id)
+            if self.table.exists(item):
+                self.table.item(item, values=values)
+            else:
+                self.table.insert('', 'end', iid=item, values=values)
+        self.frame.after(self.refresh_interval, self.refresh)
 
 class mainMenu:
     def __init__(self, master):
@@ -114,54 +236,62 @@ class mainMenu:
 
         Button(self.frame, text='Composition Scan', command=self.compositionFrame).grid(row=2, column=1, columnspan=3, rowspan=2, sticky=N + S + E + W, pady=3)
         Button(self.frame, text="Predict Output", command=self.openPredictionThread).grid(row=4, column=1, columnspan=3, rowspan=2, sticky=N + S + E + W, pady=3)
+        Button(self.frame, text="Jobs", command=lambda: jobsWindow(self.master)).grid(row=6, column=1, columnspan=3, sticky=N + S + E + W, pady=3)
 
         # Formatting
         for x in range(5):
             Grid.columnconfigure(self.frame, x, weight=1)
-        for y in range(7):
+        for y in range(8):
             Grid.rowconfigure(self.frame, y, weight=1)
         self.frame.pack(anchor=N, fill=BOTH, expand=True, side=LEFT)
 
     def compositionFrame(self):
-        if threading.active_count() != 1:
-            tk.messagebox.showerror('Error', 'Please Wait For Process To Finish')
-        else:
-            compositionScanFrame(self.master, scanSettings(self.mode_box.get()))
-            self.frame.destroy()
+        compositionScanFrame(self.master, scanSettings(self.mode_box.get()))
+        self.frame.destroy()
 
-    def runThreadedPrediction(self):
-        my_predictor = predictOutput(self.prediction_dataset, get_models(), self.mode_box.get())
-        my_predictor.run()
+    def runThreadedPrediction(self, job, dataset_path, mode, console):
+        console.attach()
+        try:
+            my_predictor = predictOutput(dataset_path, get_models(mode), mode)
+            my_predictor.cancel_event = job.cancel_event
+            my_predictor.addCallback(console.trackProgress)
+            my_predictor.run()
+        except jobCancelled:
+            print('==========Prediction Cancelled==========')
+            raise
+        except Exception:
+            traceback.print_exc()
+            raise
+        finally:
+            console.detach()
         for folder in os.listdir('models/'):
             if os.path.isdir('models/' + folder):
-                shutil.rmtree('models/' + folder)
+                shutil.rmtree('models/' + folder, ignore_errors=True)
 
 
     def openPredictionThread(self):
-        if threading.active_count() != 1:
-            tk.messagebox.showerror('Error', 'Please Wait For Process To Finish')
-        else:
-            try:
-                os.mkdir('prediction_datasets/')
-            except FileExistsError:
-                pass
-            try:
-                os.mkdir('prediction_datasets/' + self.mode_box.get())
-            except FileExistsError:
-                pass
-            file_types = ['Dataset', '.csv'],
-            filename = filedialog.askopenfilename(initialdir=os.getcwd() + '/prediction_datasets/' + self.mode_box.get(),
-                                                       title='Select Dataset',
-                                                       filetypes=file_types, defaultextension='.csv')
-            try:
-                self.prediction_dataset = filename
-                if self.prediction_dataset is None or self.prediction_dataset == '':
-                    tk.messagebox.showerror('Error', 'Unable To Load Dataset ''')
-                else:
-                    consoleWindow(self.master)
-                    threading.Thread(target=self.runThreadedPrediction).start()
-            except Exception:
-                tk.messagebox.showerror('Error Loading Dataset', 'Unable To Open File: %r' % filename)
+        try:
+            os.mkdir('prediction_datasets/')
+        except FileExistsError:
+            pass
+        try:
+            os.mkdir('prediction_datasets/' + self.mode_box.get())
+        except FileExistsError:
+            pass
+        file_types = ['Dataset', '.csv'],
+        filename = filedialog.askopenfilename(initialdir=os.getcwd() + '/prediction_datasets/' + self.mode_box.get(),
+                                                   title='Select Dataset',
+                                                   filetypes=file_types, defaultextension='.csv')
+        try:
+            self.prediction_dataset = filename
+            if self.prediction_dataset is None or self.prediction_dataset == '':
+                tk.messagebox.showerror('Error', 'Unable To Load Dataset ''')
+            else:
+                name = 'Predict ' + os.path.basename(self.prediction_dataset)
+                console = consoleWindow(self.master, 'AlloyML Console - ' + name)
+                jobs.submit(name, self.runThreadedPrediction, self.prediction_dataset, self.mode_box.get(), console)
+        except Exception:
+            tk.messagebox.showerror('Error Loading Dataset', 'Unable To Open File: %r' % filename)
 
 class compositionScanFrame:
     def captureConfig(self):
@@ -224,27 +354,58 @@ class compositionScanFrame:
         except Exception:
             tk.messagebox.showerror('Error Saving Configuration', 'Unable to save file: %r' % filename)
 
-    def runThreadedScan(self):
-        my_composition_scan = compositionScan(self.settings, get_models())
-        my_composition_scan.run()
+    def getCheckpointPath(self):
+        return 'scan_checkpoints/' + self.settings.mode + '.pkl'
+
+    def runThreadedScan(self, job, settings, checkpoint_path, console, resume=False):
+        console.attach()
+        try:
+            my_composition_scan = compositionScan(settings, get_models(settings.mode))
+            my_composition_scan.cancel_event = job.cancel_event
+            my_composition_scan.addCallback(console.trackProgress)
+            my_composition_scan.checkpoint_path = checkpoint_path
+            if checkpoint_path is not None:
+                try:
+                    os.mkdir('scan_checkpoints/')
+                except FileExistsError:
+                    pass
+                if resume:
+                    try:
+                        my_composition_scan.loadCheckpoint(checkpoint_path)
+                    except Exception as error:
+                        print('Unable to resume scan, starting a new one: %s' % error)
+            best_loss, best_datapoint = my_composition_scan.run()
+        except jobCancelled:
+            print('==========Scan Cancelled==========')
+            raise
+        except Exception:
+            traceback.print_exc()
+            raise
+        finally:
+            console.detach()
+        if checkpoint_path is not None:
+            os.remove(checkpoint_path)
         for folder in os.listdir('models/'):
             if os.path.isdir('models/' + folder):
-                shutil.rmtree('models/' + folder)
+                shutil.rmtree('models/' + folder, ignore_errors=True)
+        return float(best_loss)
 
     def openScanThread(self):
         if self.captureConfig():
-            if threading.active_count() != 1:
-                tk.messagebox.showerror('Error', 'Please Wait For Process To Finish')
-            else:
-                consoleWindow(self.master)
-                threading.Thread(target=self.runThreadedScan).start()
+            name = 'Scan ' + self.settings.mode
+            checkpoint_path = self.getCheckpointPath()
+            resume = False
+            if any(current_job.name == name for current_job in jobs.getActive()):
+                checkpoint_path = None
+            elif os.path.isfile(checkpoint_path):
+                resume = tk.messagebox.askyesno('Resume Scan', 'An unfinished ' + self.settings.mode +
+                                                ' scan was found. Resume it?')
+            console = consoleWindow(self.master, 'AlloyML Console - ' + name)
+            jobs.submit(name, self.runThreadedScan, self.settings, checkpoint_path, console, resume)
 
     def close(self):
-        if threading.active_count() != 1:
-            tk.messagebox.showerror('Error', 'Please Wait For Process To Finish')
-        else:
-            self.frame.destroy()
-            mainMenu(self.master)
+        self.frame.destroy()
+        mainMenu(self.master)
 
     def getBackgroundColor(self, index):
         if index % 2:
@@ -342,6 +503,7 @@ class compositionScanFrame:
 
 
         # Buttons
+        Button(self.frame, text="Jobs", command=lambda: jobsWindow(self.master)).grid(row=self.num_rows-11, column=2, rowspan=2, sticky=N+S+E+W, pady=3)
         Button(self.frame, text="Run", command=self.openScanThread).grid(row=self.num_rows-9, column=2,  rowspan=2, sticky=N+S+E+W, pady=3)
         Button(self.frame, text="Load Configuration", command=self.loadSettings).grid(row=self.num_rows-7, column=2, rowspan=2, sticky=N + S + E + W, pady=3)
         Button(self.frame, text="Save Configuration", command=self.saveSettings).grid(row=self.num_rows-5, column=2, rowspan=2, sticky=N + S + E + W, pady=3)
@@ -357,11 +519,15 @@ class compositionScanFrame:
         self.frame.pack(anchor=N, fill=BOTH, expand=True, side=LEFT)
 
 
-def start_GUI(paths):
-    global model_paths
+def start_GUI(paths, max_jobs=None):
+    global model_paths, jobs
     model_paths = paths
+    jobs = jobManager(max_jobs)
+    sys.stdout = textRedirector(sys.stdout, "stdout")
+    sys.stderr = textRedirector(sys.stderr, "stderr")
     root = tk.Tk()
     root.iconbitmap('graphics/AlloyML.ico')
     root.title('AlloyML v2.4.0')
     app = mainMenu(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
+    jobs.shutdown()
\ No newline at end of file
@@ -0,0 +1,175 @@
+#!/usr/bin/python3
+import time
+start_time = time.perf_counter()
+
+import sys
+import json
+import pickle
+import argparse
+
+from src.CompositionScan import scanSettings, compositionScan
+from src.PredictOutput import predictOutput
+from src.ParallelScan import multiStartScan
+from src.Optimizers import strategies, compareStrategies
+from src.ParetoScan import paretoScan
+from src.ScreeningScan import screeningScan
+from src.SensitivityAnalysis import sensitivityAnalysis
+from src.EvaluationStore import evaluationStore
+from src.Instrumentation import phaseProfiler, jsonLinesSink
+from src.ModelRegistry import registry, default_model_paths
+
+heavy_modules = ['tensorflow', 'keras', 'scipy', 'matplotlib', 'tkinter']
+
+def loadSettings(config):
+    if 'settings' in config:
+        with open(config['settings'], 'rb') as settings_file:
+            settings = pickle.load(settings_file)
+    else:
+        settings = scanSettings(config['mode'])
+    for key in ['loss_type', 'max_steps', 'targets', 'categorical_inputs', 'range_based_inputs',
+                'early_stop_loss', 'early_stop_patience', 'early_stop_tolerance', 'uncertainty_weight']:
+        if key in config:
+            setattr(settings, key, config[key])
+    return settings
+
+def loadConfig(config_path):
+    if config_path.endswith('.pkl'):
+        with open(config_path, 'rb') as settings_file:
+            settings = pickle.load(settings_file)
+        return {'mode': settings.mode, 'settings': config_path}
+    with open(config_path, 'r') as config_file:
+        return json.load(config_file)
+
+def reportStartup(label, started):
+    loaded = [module for module in heavy_modules if module in sys.modules]
+    print('[Startup] %s after %.3fs (heavy modules loaded: %s)' %
+          (label, time.perf_counter() - started, ', '.join(loaded) if loaded else 'none'))
+
+def main(argv=None, started=None):
+    parser = argparse.ArgumentParser(prog='python -m src', description='Run AlloyML without the GUI.')
+    parser.add_argument('task', choices=['scan', 'predict', 'compare', 'pareto', 'screen'])
+    parser.add_argument('config', help='JSON configuration file or a scan configuration saved by the GUI (.pkl)')
+    parser.add_argument('--dataset', help='Prediction dataset, overrides the "dataset" entry of the configuration')
+    parser.add_argument('--restarts', type=int, help='Run this many independently seeded scans in a process pool')
+    parser.add_argument('--processes', type=int, help='Worker processes used by --restarts, defaults to the number of cores, '
+                                                       'or by screen, defaults to 1')
+    parser.add_argument('--seed', type=int, help='Seed for the scan, or for the first chain when using --restarts')
+    parser.add_argument('--strategy', choices=list(strategies.keys()), help='Search strategy used by scan, defaults to random_walk')
+    parser.add_argument('--target-loss', type=float, help='Loss that compare counts evaluations to')
+    parser.add_argument('--checkpoint', help='Periodically save the scan state to this file')
+    parser.add_argument('--checkpoint-interval', type=int, default=50, help='Steps between checkpoints')
+    parser.add_argument('--resume', action='store_true', help='Continue the scan saved in --checkpoint')
+    parser.add_argument('--output', help='Stream predictions in chunks to this CSV file instead of printing them, '
+                                         'or save the Pareto front or the best screened compositions to this CSV file')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Rows read per chunk when streaming predictions')
+    parser.add_argument('--samples', type=int, help='Compositions screened per combination of categorical inputs')
+    parser.add_argument('--sampler', choices=['lhs', 'sobol'], help='Latin hypercube or scrambled Sobol sampling for screen')
+    parser.add_argument('--top', type=int, help='Best compositions kept by screen')
+    parser.add_argument('--sensitivity', type=int, metavar='SAMPLES',
+                        help='After a scan, compute Sobol indices from this many base samples over the configured ranges '
+                             'and derivatives at the best composition')
+    parser.add_argument('--sensitivity-output', help='Save the sensitivity indices to this CSV file')
+    parser.add_argument('--store', help='Directory of evaluations kept across sessions, used to warm start scans and '
+                                        'to skip model evaluations seen before')
+    parser.add_argument('--profile', action='store_true', help='Print time spent per phase after the run')
+    parser.add_argument('--events', help='Append structured progress events to this file as JSON lines')
+    parser.add_argument('--startup-time', action='store_true',
+                        help='Report time from the start of python -m src (after interpreter startup) to the end of '
+                             'imports and of model loading')
+    args = parser.parse_args(argv)
+
+    config = loadConfig(args.config)
+    restarts = args.restarts or config.get('restarts')
+    if args.task == 'scan' and restarts:
+        for option, value in [('--store', args.store or config.get('store')), ('--events', args.events),
+                              ('--profile', args.profile)]:
+            if value:
+                parser.error('%s does not work with --restarts' % option)
+    model_paths = dict(default_model_paths)
+    model_paths.update(config.get('models', {}))
+    if args.startup_time:
+        reportStartup('Imports finished', started or start_time)
+    models = registry.getModels(model_paths, config['mode'])
+    if args.startup_time:
+        reportStartup('Models loaded', started or start_time)
+
+    sinks = []
+    if args.profile:
+        sinks.append(phaseProfiler())
+    if args.events:
+        sinks.append(jsonLinesSink(args.events))
+
+    seed = args.seed if args.seed is not None else config.get('seed')
+    strategy = args.strategy or config.get('strategy')
+    store = None
+    store_path = args.store or config.get('store')
+    if store_path and args.task in ['predict', 'scan']:
+        store = evaluationStore(store_path, registry.getIdentities(model_paths, config['mode']),
+                                decimals=None if args.task == 'predict' else 4)
+    checkpoint_path = args.checkpoint or config.get('checkpoint')
+    if args.task == 'scan' and (checkpoint_path or args.resume):
+        if restarts:
+            parser.error('--checkpoint and --resume do not work with --restarts')
+        if strategy not in [None, 'random_walk']:
+            parser.error('--checkpoint and --resume only work with the random_walk strategy')
+    if args.task == 'scan' and restarts and (args.sensitivity or config.get('sensitivity')):
+        parser.error('--sensitivity does not work with --restarts')
+    job = None
+    if args.task == 'scan' and restarts:
+        multiStartScan(loadSettings(config), model_paths, restarts, seed or 0,
+                       args.processes or config.get('processes'), strategy=strategy).run()
+    elif args.task == 'scan':
+        job = compositionScan(loadSettings(config), models, seed,
+                              strategy=strategies[strategy]() if strategy is not None else None, store=store)
+        job.checkpoint_path = checkpoint_path
+        job.checkpoint_interval = args.checkpoint_interval
+        if args.resume:
+            if job.checkpoint_path is None:
+                parser.error('--resume needs a checkpoint, pass --checkpoint or set "checkpoint" in the configuration')
+            job.loadCheckpoint(job.checkpoint_path)
+    elif args.task == 'compare':
+        target_loss = args.target_loss if args.target_loss is not None else config.get('target_loss')
+        if target_loss is None:
+            parser.error('compare needs a target loss, pass --target-loss or set "target_loss" in the configuration')
+        compareStrategies(loadSettings(config), models, target_loss)
+    elif args.task == 'pareto':
+        if config['mode'] != 'Mechanical':
+            parser.error('pareto needs a Mechanical configuration')
+        job = paretoScan(loadSettings(config), models, seed)
+    elif args.task == 'screen':
+        job = screeningScan(loadSettings(config), models, seed, samples=args.samples or config.get('samples', 100000),
+                            sampler=args.sampler or config.get('sampler', 'lhs'), top=args.top or config.get('top', 100),
+                            processes=args.processes or config.get('processes', 1), model_paths=model_paths)
+    elif args.task == 'predict':
+        dataset_path = args.dataset or config.get('dataset')
+        if dataset_path is None:
+            parser.error('predict needs a dataset, pass --dataset or set "dataset" in the configuration')
+        job = predictOutput(dataset_path, models, config['mode'], args.output or config.get('output'),
+                            args.chunk_size, store)
+
+    if job is not None:
+        for sink in sinks:
+            job.addCallback(sink)
+        try:
+            result = job.run()
+        finally:
+            if store is not None:
+                store.close()
+                if args.task == 'predict':
+                    store.printStats()
+        sensitivity_samples = args.sensitivity or config.get('sensitivity')
+        if args.task == 'scan' and sensitivity_samples:
+            analysis = sensitivityAnalysis(job, sensitivity_samples, seed=seed or 0)
+            analysis.run(result[1])
+            if args.sensitivity_output or config.get('sensitivity_output'):
+                analysis.exportCSV(args.sensitivity_output or config.get('sensitivity_output'))
+        if args.task in ['pareto', 'screen'] and (args.output or config.get('output')):
+            job.exportCSV(args.output or config.get('output'))
+    for sink in sinks:
+        if isinstance(sink, phaseProfiler):
+            sink.report()
+        elif isinstance(sink, jsonLinesSink):
+            sink.close()
+
+if __name__ == '__main__':
+    main()
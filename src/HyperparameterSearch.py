@@ -0,0 +1,183 @@
+#!/usr/bin/python3
+import os
+import json
+import math
+import time
+import hashlib
+import itertools
+import multiprocessing
+
+import numpy as np
+
+from src.TrainModel import modelTrainer
+from src.Instrumentation import eventEmitter
+
+worker_trainer = None
+
+def configureThreads(threads):
+    import tensorflow as tf
+    if hasattr(tf, 'ConfigProto'):
+        from keras import backend
+        backend.set_session(tf.Session(config=tf.ConfigProto(intra_op_parallelism_threads=threads,
+                                                             inter_op_parallelism_threads=threads)))
+    else:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+def initWorker(mode, dataset_path, threads):
+    global worker_trainer
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    configureThreads(threads)
+    worker_trainer = modelTrainer(mode, verbosity=0, dataset_path=dataset_path, train=False)
+    worker_trainer.activateTestSplit()
+    worker_trainer.threads = threads
+
+def trainTrial(arguments):
+    trial, params, epochs, model_path = arguments
+    from keras import backend
+    backend.clear_session()
+    configureThreads(worker_trainer.threads)
+    start_time = time.perf_counter()
+    params = dict(params)
+    params['epochs'] = epochs
+    history, model = worker_trainer.model(None, None, None, None, params)
+    if model_path is not None:
+        model.save(model_path)
+    history = {key: [float(value) for value in values] for key, values in history.history.items()}
+    return {'trial': trial, 'epochs': epochs, 'val_loss': history['val_loss'][-1], 'history': history,
+            'model_path': model_path, 'elapsed': time.perf_counter() - start_time}
+
+def trainMember(arguments):
+    seed, params, bootstrap, model_path = arguments
+    import tensorflow as tf
+    from keras import backend
+    backend.clear_session()
+    configureThreads(worker_trainer.threads)
+    np.random.seed(seed)
+    if hasattr(tf, 'set_random_seed'):
+        tf.set_random_seed(seed)
+    else:
+        tf.random.set_seed(seed)
+    X_train = worker_trainer.dataset['X_train']
+    Y_train = worker_trainer.dataset['Y_train']
+    if bootstrap:
+        sample = np.random.RandomState(seed).choice(X_train.shape[0], X_train.shape[0])
+        worker_trainer.dataset['X_train'] = X_train[sample]
+        worker_trainer.dataset['Y_train'] = Y_train[sample]
+    try:
+        history, model = worker_trainer.model(None, None, None, None, params)
+    finally:
+        worker_trainer.dataset['X_train'] = X_train
+        worker_trainer.dataset['Y_train'] = Y_train
+    model.save(model_path)
+    return seed, float(history.history['val_loss'][-1])
+
+class hyperparameterSearch(eventEmitter):
+    def __init__(self, trainer, trials=None, processes=None, threads_per_worker=1, reduction_factor=3,
+                 min_epochs=1, seed=0, results_dir='hyperparameter_search'):
+        self.trainer = trainer
+        self.trials = trials
+        self.processes = processes
+        self.threads_per_worker = threads_per_worker
+        self.reduction_factor = reduction_factor
+        self.min_epochs = min_epochs
+        self.seed = seed
+        self.results_dir = results_dir
+        self.callbacks = []
+        self.records = {}
+
+    def getConfigurations(self):
+        keys = sorted(self.trainer.params.keys())
+        grid = [dict(zip(keys, values)) for values in itertools.product(*[self.trainer.params[key] for key in keys])]
+        if self.trials is not None and self.trials < len(grid):
+            chosen = np.random.RandomState(self.seed).choice(len(grid), self.trials, replace=False)
+            grid = [grid[index] for index in sorted(chosen)]
+        return [('trial_%03d' % index, params) for index, params in enumerate(grid)]
+
+    def getSearchKey(self):
+        description = json.dumps([self.trainer.mode, self.trainer.hashDataset(self.trainer.dataset_path),
+                                  self.trainer.params, self.trials, self.seed, self.reduction_factor, self.min_epochs],
+                                 sort_keys=True)
+        return '%s_%s' % (self.trainer.mode, hashlib.sha256(description.encode('utf-8')).hexdigest()[:16])
+
+    def getRungs(self, configurations):
+        return int(math.floor(math.log(max(len(configurations), 1)) / math.log(self.reduction_factor) + 1e-9))
+
+    def getEpochs(self, params, rung, rungs):
+        return max(self.min_epochs, int(round(params['epochs'] / float(self.reduction_factor ** (rungs - rung)))))
+
+    def loadRecords(self, results_path):
+        if not os.path.isfile(results_path):
+            return
+        with open(results_path, 'r') as results_file:
+            for line in results_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self.records[(record['trial'], record['epochs'])] = record
+
+    def runRung(self, pool, tasks, results_file, rung):
+        for record in pool.imap_unordered(trainTrial, tasks):
+            record['rung'] = rung
+            self.records[(record['trial'], record['epochs'])] = record
+            results_file.write(json.dumps(record) + '\n')
+            results_file.flush()
+            print('[Rung %d] %s: val_loss = %f after %d epochs (%.1fs)' %
+                  (rung, record['trial'], record['val_loss'], record['epochs'], record['elapsed']))
+            self.emit('trial', phase='rung_%d' % rung, trial=record['trial'], epochs=record['epochs'],
+                      val_loss=record['val_loss'])
+
+    def run(self):
+        start_time = time.perf_counter()
+        configurations = self.getConfigurations()
+        rungs = self.getRungs(configurations)
+        search_key = self.getSearchKey()
+        model_dir = os.path.join(self.results_dir, search_key)
+        os.makedirs(model_dir, exist_ok=True)
+        results_path = os.path.join(self.results_dir, search_key + '.jsonl')
+        self.loadRecords(results_path)
+        if self.records:
+            print('Resuming search with %d finished trials from: %s' % (len(self.records), results_path))
+        processes = min(self.processes or max(multiprocessing.cpu_count() // self.threads_per_worker, 1),
+                        len(configurations))
+        self.emit('start', mode=self.trainer.mode, trials=len(configurations), rungs=rungs + 1)
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(processes, initializer=initWorker,
+                          initargs=(self.trainer.mode, self.trainer.dataset_path, self.threads_per_worker)) as pool, \
+                open(results_path, 'a') as results_file:
+            active = configurations
+            for rung in range(rungs + 1):
+                final = rung == rungs
+                tasks = []
+                for trial, params in active:
+                    epochs = self.getEpochs(params, rung, rungs)
+                    record = self.records.get((trial, epochs))
+                    if record is not None and (not final or os.path.isfile(record['model_path'] or '')):
+                        continue
+                    tasks.append((trial, params, epochs, os.path.join(model_dir, trial + '.h5') if final else None))
+                self.runRung(pool, tasks, results_file, rung)
+                scores = [self.records[(trial, self.getEpochs(params, rung, rungs))]['val_loss'] for trial, params in active]
+                order = np.argsort(scores, kind='stable')
+                if not final:
+                    active = [active[index] for index in order[:max(len(active) // self.reduction_factor, 1)]]
+        best_trial, best_params = active[order[0]]
+        best = dict(self.records[(best_trial, self.getEpochs(best_params, rungs, rungs))])
+        best['params'] = best_params
+        print('Searched %d configurations over %d rungs in %.1fs, best %s val_loss = %f' %
+              (len(configurations), rungs + 1, time.perf_counter() - start_time, best_trial, best['val_loss']))
+        self.emit('finish', trial=best_trial, val_loss=best['val_loss'])
+        return best
+
+    def trainEnsemble(self, params, model_paths, bootstrap=False):
+        start_time = time.perf_counter()
+        processes = min(self.processes or max(multiprocessing.cpu_count() // self.threads_per_worker, 1), len(model_paths))
+        arguments = [(self.seed + index, params, bootstrap, model_path) for index, model_path in enumerate(model_paths)]
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(processes, initializer=initWorker,
+                          initargs=(self.trainer.mode, self.trainer.dataset_path, self.threads_per_worker)) as pool:
+            for seed, val_loss in pool.imap(trainMember, arguments):
+                print('[Ensemble] member seed %d: val_loss = %f' % (seed, val_loss))
+                self.emit('member', seed=seed, val_loss=val_loss)
+        print('Trained %d ensemble members in %.1fs' % (len(model_paths), time.perf_counter() - start_time))
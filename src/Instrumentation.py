@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+import json
+import time
+import threading
+from collections import OrderedDict
+
+timing_keys = ['sampling_time', 'inference_time', 'loss_time', 'io_time']
+
+class eventEmitter:
+    def addCallback(self, callback):
+        if not hasattr(self, 'callbacks'):
+            self.callbacks = []
+        self.callbacks.append(callback)
+        return callback
+
+    def removeCallback(self, callback):
+        self.callbacks.remove(callback)
+
+    def emit(self, event, **data):
+        callbacks = getattr(self, 'callbacks', None)
+        if not callbacks:
+            return
+        data['event'] = event
+        data['time'] = time.time()
+        for callback in callbacks:
+            callback(data)
+
+class jobCancelled(Exception):
+    pass
+
+class cancellable:
+    def checkCancelled(self):
+        cancel_event = getattr(self, 'cancel_event', None)
+        if cancel_event is not None and cancel_event.is_set():
+            raise jobCancelled('Cancelled by request')
+
+class phaseTimer:
+    def __init__(self):
+        self.totals = dict((key, 0.0) for key in timing_keys)
+        self.reported = dict(self.totals)
+
+    def add(self, key, elapsed):
+        self.totals[key] += elapsed
+
+    def delta(self):
+        delta = dict((key, self.totals[key] - self.reported[key]) for key in timing_keys)
+        self.reported = dict(self.totals)
+        return delta
+
+class phaseProfiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = OrderedDict()
+        self.events = OrderedDict()
+
+    def __call__(self, event):
+        with self.lock:
+            self.events[event['event']] = self.events.get(event['event'], 0) + 1
+            if 'phase' not in event:
+                return
+            phase = self.phases.setdefault(event['phase'], OrderedDict([('events', 0), ('evaluated', 0)] +
+                                                                        [(key, 0.0) for key in timing_keys]))
+            phase['events'] += 1
+            phase['evaluated'] += event.get('evaluated', 0)
+            for key in timing_keys:
+                phase[key] += event.get(key, 0.0)
+
+    def getSummary(self):
+        with self.lock:
+            return {'phases': json.loads(json.dumps(self.phases)), 'events': dict(self.events)}
+
+    def report(self):
+        print('==========Profile==========')
+        for phase, totals in self.getSummary()['phases'].items():
+            elapsed = sum(totals[key] for key in timing_keys)
+            print('%s: %d events, %d evaluated, %.3fs sampling, %.3fs inference, %.3fs loss, %.3fs io (%.0f evaluated/sec)' %
+                  (phase, totals['events'], totals['evaluated'], totals['sampling_time'], totals['inference_time'],
+                   totals['loss_time'], totals['io_time'], totals['evaluated'] / max(elapsed, 1e-9)))
+
+class jsonLinesSink:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, 'a')
+
+    def __call__(self, event):
+        with self.lock:
+            self.file.write(json.dumps(event, default=float) + '\n')
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
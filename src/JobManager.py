@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+import time
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from src.Instrumentation import eventEmitter, jobCancelled
+
+# jobs run as threads and share the GIL, so more workers only interleave CPU-bound scans
+default_max_workers = 2
+
+class job:
+    def __init__(self, job_id, name, function, args):
+        self.job_id = job_id
+        self.name = name
+        self.function = function
+        self.args = args
+        self.status = 'queued'
+        self.submit_time = time.time()
+        self.start_time = None
+        self.end_time = None
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.future is not None and self.future.cancel():
+            self.status = 'cancelled'
+            self.end_time = time.time()
+
+    def isActive(self):
+        return self.status in ['queued', 'running']
+
+    def getElapsed(self):
+        if self.start_time is None:
+            return 0.0
+        return (self.end_time or time.time()) - self.start_time
+
+    def getSummary(self):
+        return {'id': self.job_id, 'name': self.name, 'status': self.status, 'elapsed': self.getElapsed(),
+                'result': self.result, 'error': self.error}
+
+class jobManager(eventEmitter):
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or default_max_workers
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()
+        self.next_id = 1
+        self.callbacks = []
+
+    def submit(self, name, function, *args):
+        with self.lock:
+            new_job = job(self.next_id, name, function, args)
+            self.jobs[new_job.job_id] = new_job
+            self.next_id += 1
+        new_job.future = self.executor.submit(self.runJob, new_job)
+        self.emit('job', **new_job.getSummary())
+        return new_job
+
+    def runJob(self, current_job):
+        if current_job.cancel_event.is_set():
+            current_job.status = 'cancelled'
+            current_job.end_time = time.time()
+            return None
+        current_job.status = 'running'
+        current_job.start_time = time.time()
+        self.emit('job', **current_job.getSummary())
+        try:
+            current_job.result = current_job.function(current_job, *current_job.args)
+            current_job.status = 'finished'
+        except jobCancelled:
+            current_job.status = 'cancelled'
+        except Exception as error:
+            current_job.status = 'failed'
+            current_job.error = '%s: %s' % (type(error).__name__, error)
+            traceback.print_exc()
+        finally:
+            current_job.end_time = time.time()
+            self.emit('job', **current_job.getSummary())
+        return current_job.result
+
+    def cancel(self, job_id):
+        self.jobs[job_id].cancel()
+
+    def getJobs(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def getActive(self):
+        return [current_job for current_job in self.getJobs() if current_job.isActive()]
+
+    def shutdown(self, cancel=True):
+        if cancel:
+            for current_job in self.getActive():
+                current_job.cancel()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+import os
+import csv
+import json
+import argparse
+
+import numpy as np
+
+from src import NumpyModel
+
+export_dtypes = ['float32', 'float16', 'int8']
+
+def quantizeKernel(kernel, dtype):
+    if dtype == 'int8':
+        scale = np.abs(kernel).max(axis=0) / 127.0
+        scale[scale == 0] = 1.0
+        return np.round(kernel / scale).astype(np.int8), scale.astype(np.float32)
+    return kernel.astype(dtype), None
+
+def readColumns(dataset_path, input_dim):
+    with open(dataset_path, 'r') as dataset_file:
+        return next(csv.reader(dataset_file))[:input_dim]
+
+def exportModel(model_path, output_path, dtype='float32', dataset_path=None):
+    if dtype not in export_dtypes:
+        raise ValueError('Unsupported export type: %s' % dtype)
+    model = NumpyModel.load_model(model_path)
+    if not isinstance(model, NumpyModel.numpyModel):
+        raise ValueError('Only single models can be exported, export ensemble members one at a time')
+    output_path = os.path.splitext(output_path)[0]
+    weights_path = output_path + '.bin'
+    manifest = {'format': 'flat', 'source': os.path.basename(model_path), 'dtype': dtype,
+                'weights': os.path.basename(weights_path), 'input_dim': model.input_dim,
+                'columns': readColumns(dataset_path, model.input_dim) if dataset_path else model.columns, 'layers': []}
+    offset = 0
+    with open(weights_path, 'wb') as weights_file:
+        def write(array):
+            nonlocal offset
+            padding = -offset % 16
+            weights_file.write(b'\0' * padding)
+            offset += padding
+            entry = {'dtype': array.dtype.name, 'shape': list(array.shape), 'offset': offset}
+            weights_file.write(np.ascontiguousarray(array).tobytes())
+            offset += array.nbytes
+            return entry
+
+        for index, (kernel, bias, activation) in enumerate(model.layers):
+            quantized, scale = quantizeKernel(model.getKernel(index), dtype)
+            layer = {'activation': activation, 'kernel': write(quantized),
+                     'bias': write(np.asarray(bias, dtype=np.float32))}
+            if scale is not None:
+                layer['scale'] = write(scale)
+            manifest['layers'].append(layer)
+    with open(output_path + '.json', 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    print('Model exported to: %s.json (%d bytes of %s weights)' % (output_path, offset, dtype))
+    return output_path + '.json'
+
+def accuracyReport(original_path, exported_path, dataset_path, mode=None):
+    original = NumpyModel.load_model(original_path)
+    exported = NumpyModel.load_model(exported_path)
+    if mode is not None:
+        from src.TrainModel import modelTrainer
+        trainer = modelTrainer(mode, dataset_path=dataset_path, train=False)
+        inputs = trainer.dataset['full'][:, :original.input_dim]
+        targets = trainer.dataset['full'][:, original.input_dim:]
+    else:
+        inputs = np.atleast_2d(np.genfromtxt(dataset_path, delimiter=',', skip_header=1, dtype=float))
+        inputs = inputs[:, :original.input_dim]
+        inputs = inputs[~np.isnan(inputs).any(axis=1)]
+        targets = None
+    original_outputs = original.predict(inputs)
+    exported_outputs = exported.predict(inputs)
+    deviation = np.abs(exported_outputs - original_outputs)
+    report = {'rows': inputs.shape[0], 'mean_deviation': deviation.mean(axis=0).tolist(),
+              'max_deviation': deviation.max(axis=0).tolist()}
+    print('Compared on %d rows of %s' % (inputs.shape[0], dataset_path))
+    for column in range(original_outputs.shape[1]):
+        print('[Output %d] mean deviation %f, max deviation %f' %
+              (column, deviation[:, column].mean(), deviation[:, column].max()))
+    if targets is not None and targets.shape[1] == original_outputs.shape[1]:
+        report['original_error'] = np.abs(original_outputs - targets).mean(axis=0).tolist()
+        report['exported_error'] = np.abs(exported_outputs - targets).mean(axis=0).tolist()
+        for column in range(targets.shape[1]):
+            print('[Output %d] mean absolute error %f original, %f exported' %
+                  (column, report['original_error'][column], report['exported_error'][column]))
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m src.ModelExport',
+                                     description='Export a trained model to a flat, memory-mappable weight file.')
+    parser.add_argument('model', help='Trained .h5 model')
+    parser.add_argument('output', help='Output path, writes <output>.json and <output>.bin')
+    parser.add_argument('--dtype', choices=export_dtypes, default='float32',
+                        help='Storage type of the weights. All types stay memory-mapped, float16 and int8 kernels '
+                             'are widened to float32 one layer at a time during each forward pass')
+    parser.add_argument('--dataset', help='Training CSV used for the input column names and the accuracy report')
+    parser.add_argument('--mode', help='Training mode of the model, adds the error against the dataset targets to the report')
+    args = parser.parse_args(argv)
+
+    manifest_path = exportModel(args.model, args.output, args.dtype, args.dataset)
+    if args.dataset:
+        accuracyReport(args.model, manifest_path, args.dataset, args.mode)
+
+if __name__ == '__main__':
+    main()
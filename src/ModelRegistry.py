@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+import os
+import time
+import hashlib
+import threading
+
+from src import NumpyModel
+from src.CompositionScan import multi_output_models
+
+default_model_paths = {
+    'DoS': 'models/DoS_model_1598512707210.h5',
+    'elongation': 'models/Elongation_model_1598512057434.h5',
+    'tensile': 'models/Tensile_model_1598512362019.h5',
+    'yield': 'models/Yield_model_1598512418828.h5'
+}
+
+mode_models = {
+    'DoS': ['DoS'],
+    'Mechanical': ['elongation', 'tensile', 'yield']
+}
+
+def loadModel(model_path):
+    if model_path.endswith('.json'):
+        return NumpyModel.load_model(model_path, compile=False)
+    try:
+        return NumpyModel.load_model(model_path, compile=False)
+    except (ValueError, KeyError, OSError):
+        from tensorflow import keras
+        return keras.models.load_model(model_path, compile=False)
+
+class modelRegistry:
+    def __init__(self, loader=loadModel):
+        self.loader = loader
+        self.lock = threading.RLock()
+        self.models = {}
+        self.hits = 0
+        self.misses = 0
+        self.load_time = 0.0
+        self.load_times = {}
+        self.identities = {}
+
+    def loadEnsemble(self, model_paths):
+        members = [self.load(model_path) for model_path in model_paths]
+        key = tuple(os.path.abspath(model_path) for model_path in model_paths)
+        with self.lock:
+            entry = self.models.get(key)
+            if entry is not None and all(cached is member for cached, member in zip(entry[0], members)):
+                return entry[1]
+            if not all(isinstance(member, NumpyModel.numpyModel) for member in members):
+                raise ValueError('Ensemble members must load with the NumPy backend')
+            model = NumpyModel.ensembleModel(members)
+            self.models[key] = (members, model)
+            return model
+
+    def load(self, model_path):
+        if isinstance(model_path, (list, tuple)):
+            return self.loadEnsemble(model_path)
+        model_path = os.path.abspath(model_path)
+        mtime = tuple(os.path.getmtime(path) for path in NumpyModel.get_model_files(model_path))
+        with self.lock:
+            entry = self.models.get(model_path)
+            if entry is not None and entry[0] == mtime:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            start_time = time.perf_counter()
+            model = self.loader(model_path)
+            elapsed = time.perf_counter() - start_time
+            self.load_time += elapsed
+            self.load_times[model_path] = elapsed
+            self.models[model_path] = (mtime, model)
+            return model
+
+    def getModels(self, model_paths, mode=None):
+        keys = model_paths.keys() if mode is None else mode_models[mode]
+        if mode in multi_output_models and multi_output_models[mode][0] in model_paths:
+            keys = [multi_output_models[mode][0]]
+        return {key: self.load(model_paths[key]) for key in keys}
+
+    def getIdentity(self, model_path):
+        if isinstance(model_path, (list, tuple)):
+            return hashlib.sha1(''.join(self.getIdentity(path) for path in model_path).encode('ascii')).hexdigest()[:16]
+        model_files = NumpyModel.get_model_files(os.path.abspath(model_path))
+        if len(model_files) == 1:
+            return self.hashFile(model_files[0])
+        return hashlib.sha1(''.join(self.hashFile(path) for path in model_files).encode('ascii')).hexdigest()[:16]
+
+    def hashFile(self, model_path):
+        model_path = os.path.abspath(model_path)
+        status = os.stat(model_path)
+        with self.lock:
+            entry = self.identities.get(model_path)
+            if entry is not None and entry[0] == (status.st_mtime, status.st_size):
+                return entry[1]
+        digest = hashlib.sha1()
+        with open(model_path, 'rb') as model_file:
+            for block in iter(lambda: model_file.read(1 << 20), b''):
+                digest.update(block)
+        with self.lock:
+            self.identities[model_path] = ((status.st_mtime, status.st_size), digest.hexdigest()[:16])
+        return digest.hexdigest()[:16]
+
+    def getIdentities(self, model_paths, mode=None):
+        keys = model_paths.keys() if mode is None else mode_models[mode]
+        if mode in multi_output_models and multi_output_models[mode][0] in model_paths:
+            keys = [multi_output_models[mode][0]]
+        return {key: (model_paths[key], self.getIdentity(model_paths[key])) for key in keys}
+
+    def invalidate(self, model_path=None):
+        with self.lock:
+            if model_path is None:
+                self.models.clear()
+            else:
+                key = tuple(os.path.abspath(path) for path in model_path) if isinstance(model_path, (list, tuple)) \
+                    else os.path.abspath(model_path)
+                self.models.pop(key, None)
+
+    def getStats(self):
+        with self.lock:
+            return {'cached': len(self.models),
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'load_time': self.load_time,
+                    'load_times': dict(self.load_times)}
+
+registry = modelRegistry()
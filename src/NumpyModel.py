@@ -0,0 +1,193 @@
+#!/usr/bin/python3
+import os
+import json
+import numpy as np
+
+activations = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'sigmoid': lambda x: 1 / (1 + np.exp(-x)),
+    'tanh': np.tanh,
+    'elu': lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0)))
+}
+
+derivatives = {
+    'linear': lambda x: np.ones_like(x),
+    'relu': lambda x: (x > 0).astype(x.dtype),
+    'sigmoid': lambda x: activations['sigmoid'](x) * (1 - activations['sigmoid'](x)),
+    'tanh': lambda x: 1 - np.tanh(x) ** 2,
+    'elu': lambda x: np.where(x > 0, 1, np.exp(np.minimum(x, 0)))
+}
+
+class numpyModel:
+    def __init__(self, layers, input_dim, columns=None, scales=None):
+        self.layers = layers
+        self.input_dim = input_dim
+        self.columns = columns
+        self.scales = scales or [None] * len(layers)
+
+    @classmethod
+    def fromFlat(cls, manifest_path, manifest):
+        weights_path = os.path.join(os.path.dirname(os.path.abspath(manifest_path)), manifest['weights'])
+        data = np.memmap(weights_path, dtype=np.uint8, mode='r')
+
+        def view(entry):
+            dtype = np.dtype(entry['dtype'])
+            size = int(np.prod(entry['shape'])) * dtype.itemsize
+            return data[entry['offset']:entry['offset'] + size].view(dtype).reshape(entry['shape'])
+
+        layers = []
+        scales = []
+        for layer in manifest['layers']:
+            layers.append((view(layer['kernel']), view(layer['bias']), layer['activation']))
+            scales.append(view(layer['scale']) if 'scale' in layer else None)
+        return cls(layers, manifest['input_dim'], manifest.get('columns'), scales)
+
+    @classmethod
+    def fromH5(cls, model_path):
+        import h5py
+        with h5py.File(model_path, 'r') as model_file:
+            config = model_file.attrs['model_config']
+            if isinstance(config, bytes):
+                config = config.decode('utf-8')
+            config = json.loads(config)
+            if config['class_name'] != 'Sequential':
+                raise ValueError('Unsupported model type: %s' % config['class_name'])
+            layer_configs = config['config']
+            if isinstance(layer_configs, dict):
+                layer_configs = layer_configs['layers']
+
+            weights_group = model_file['model_weights'] if 'model_weights' in model_file else model_file
+            layers = []
+            input_dim = None
+            for layer_config in layer_configs:
+                class_name = layer_config['class_name']
+                layer = layer_config['config']
+                if class_name in ['InputLayer', 'Dropout']:
+                    continue
+                if class_name != 'Dense':
+                    raise ValueError('Unsupported layer type: %s' % class_name)
+                activation = layer.get('activation', 'linear')
+                if activation not in activations:
+                    raise ValueError('Unsupported activation: %s' % activation)
+                group = weights_group[layer['name']]
+                weight_names = [name.decode('utf-8') if isinstance(name, bytes) else name
+                                for name in group.attrs['weight_names']]
+                kernel = np.asarray(group[[name for name in weight_names if 'kernel' in name][0]])
+                bias = [name for name in weight_names if 'bias' in name]
+                if bias:
+                    bias = np.asarray(group[bias[0]])
+                else:
+                    bias = np.zeros(kernel.shape[1], dtype=kernel.dtype)
+                if input_dim is None:
+                    input_dim = kernel.shape[0]
+                layers.append((kernel, bias, activation))
+        return cls(layers, input_dim)
+
+    def getKernel(self, index):
+        kernel = np.asarray(self.layers[index][0], dtype=np.float32)
+        if self.scales[index] is not None:
+            kernel = kernel * self.scales[index]
+        return kernel
+
+    def forward(self, outputs, index):
+        kernel, bias, activation = self.layers[index]
+        outputs = np.dot(outputs, kernel).astype(np.float32, copy=False)
+        if self.scales[index] is not None:
+            outputs = outputs * self.scales[index]
+        return outputs + bias
+
+    def predict(self, x, batch_size=None, verbose=0):
+        outputs = np.asarray(x, dtype=np.float32).reshape(-1, self.input_dim)
+        for index, (kernel, bias, activation) in enumerate(self.layers):
+            outputs = activations[activation](self.forward(outputs, index))
+        return outputs
+
+    def inputGradient(self, x):
+        outputs = np.asarray(x, dtype=np.float32).reshape(-1, self.input_dim)
+        pre_activations = []
+        for index, (kernel, bias, activation) in enumerate(self.layers):
+            pre_activations.append(self.forward(outputs, index))
+            outputs = activations[activation](pre_activations[-1])
+        jacobian = None
+        for index, pre_activation in zip(reversed(range(len(self.layers))), reversed(pre_activations)):
+            kernel, activation = self.getKernel(index), self.layers[index][2]
+            local = derivatives[activation](pre_activation)
+            if jacobian is None:
+                jacobian = local[:, :, np.newaxis] * kernel.T[np.newaxis, :, :]
+            else:
+                jacobian = np.matmul(jacobian * local[:, np.newaxis, :], kernel.T)
+        return outputs, jacobian
+
+class ensembleModel:
+    def __init__(self, members):
+        architectures = [[(kernel.shape, activation) for kernel, bias, activation in member.layers] for member in members]
+        if any(architecture != architectures[0] for architecture in architectures):
+            raise ValueError('Ensemble members need identical architectures')
+        self.members = members
+        self.input_dim = members[0].input_dim
+        self.layers = [(np.stack([member.getKernel(index) for member in members]),
+                        np.stack([member.layers[index][1] for member in members])[:, np.newaxis, :],
+                        members[0].layers[index][2])
+                       for index in range(len(members[0].layers))]
+
+    @classmethod
+    def fromManifest(cls, manifest_path, manifest):
+        directory = os.path.dirname(os.path.abspath(manifest_path))
+        return cls([load_model(os.path.join(directory, member)) for member in manifest['members']])
+
+    def predictMembers(self, x):
+        outputs = np.asarray(x, dtype=np.float32).reshape(-1, self.input_dim)
+        for kernel, bias, activation in self.layers:
+            outputs = activations[activation](np.matmul(outputs, kernel) + bias)
+        return outputs
+
+    def predictDistribution(self, x):
+        outputs = self.predictMembers(x)
+        return outputs.mean(axis=0), outputs.std(axis=0)
+
+    def predict(self, x, batch_size=None, verbose=0, return_std=False):
+        mean, std = self.predictDistribution(x)
+        return np.hstack([mean, std]) if return_std else mean
+
+    def inputGradient(self, x, return_std=False):
+        outputs = np.asarray(x, dtype=np.float32).reshape(-1, self.input_dim)
+        pre_activations = []
+        for kernel, bias, activation in self.layers:
+            pre_activations.append(np.matmul(outputs, kernel) + bias)
+            outputs = activations[activation](pre_activations[-1])
+        jacobian = None
+        for (kernel, bias, activation), pre_activation in zip(reversed(self.layers), reversed(pre_activations)):
+            local = derivatives[activation](pre_activation)
+            kernel = np.transpose(kernel, (0, 2, 1))[:, np.newaxis, :, :]
+            if jacobian is None:
+                jacobian = local[:, :, :, np.newaxis] * kernel
+            else:
+                jacobian = np.matmul(jacobian * local[:, :, np.newaxis, :], kernel)
+        mean, mean_jacobian = outputs.mean(axis=0), jacobian.mean(axis=0)
+        if not return_std:
+            return mean, mean_jacobian
+        std = outputs.std(axis=0)
+        std_jacobian = np.mean((outputs - mean)[..., np.newaxis] * (jacobian - mean_jacobian), axis=0)
+        std_jacobian = np.where(std[..., np.newaxis] > 0, std_jacobian / np.maximum(std, 1e-12)[..., np.newaxis], 0)
+        return mean, mean_jacobian, std, std_jacobian
+
+def get_model_files(model_path):
+    if not model_path.endswith('.json'):
+        return [model_path]
+    with open(model_path, 'r') as manifest_file:
+        manifest = json.load(manifest_file)
+    directory = os.path.dirname(os.path.abspath(model_path))
+    if 'members' in manifest:
+        return [model_path] + [path for member in manifest['members']
+                               for path in get_model_files(os.path.join(directory, member))]
+    return [model_path, os.path.join(directory, manifest['weights'])]
+
+def load_model(model_path, compile=False):
+    if model_path.endswith('.json'):
+        with open(model_path, 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+        if 'members' in manifest:
+            return ensembleModel.fromManifest(model_path, manifest)
+        return numpyModel.fromFlat(model_path, manifest)
+    return numpyModel.fromH5(model_path)
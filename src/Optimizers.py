@@ -0,0 +1,293 @@
+#!/usr/bin/python3
+import io
+import time
+import itertools
+from contextlib import redirect_stdout
+import numpy as np
+
+from src.CompositionScan import AlPopulation, compositionScan
+
+class searchSpace:
+    def __init__(self, scan):
+        self.categorical_keys = list(scan.categorical_inputs.keys())
+        self.range_based_keys = list(scan.range_based_inputs.keys())
+        self.categorical_options = [np.ravel(scan.categorical_inputs[key]).astype(float) for key in self.categorical_keys]
+        bounds = np.asarray(list(scan.range_based_inputs.values()), dtype=float)
+        self.lower = bounds.min(axis=1)
+        self.upper = bounds.max(axis=1)
+        self.varied = np.flatnonzero(self.upper != self.lower)
+        self.dimensions = len(self.varied)
+
+    def sampleChoices(self, random_state, size, probabilities=None):
+        choices = np.zeros((size, len(self.categorical_options)), dtype=int)
+        for index, options in enumerate(self.categorical_options):
+            p = None if probabilities is None else probabilities[index]
+            choices[:, index] = random_state.choice(len(options), size, p=p)
+        return choices
+
+    def decode(self, unit, choices):
+        size = choices.shape[0]
+        range_values = np.repeat(self.lower[np.newaxis, :], size, axis=0)
+        range_values[:, self.varied] = np.round(self.lower[self.varied] +
+                                                np.clip(unit, 0, 1) * (self.upper[self.varied] - self.lower[self.varied]), 2)
+        categorical_values = np.zeros((size, len(self.categorical_options)))
+        for index, options in enumerate(self.categorical_options):
+            categorical_values[:, index] = options[choices[:, index]]
+        return AlPopulation(self.categorical_keys, self.range_based_keys, categorical_values, range_values)
+
+class randomWalkStrategy:
+    def search(self, scan):
+        return scan.randomWalk()
+
+class optimizerStrategy:
+    def __init__(self, max_evaluations):
+        self.max_evaluations = max_evaluations
+        self.best_loss = None
+        self.best_datapoint = None
+
+    def evaluate(self, scan, space, unit, choices):
+        scan.checkCancelled()
+        start_time = time.perf_counter()
+        candidates = space.decode(unit, choices)
+        scan.timer.add('sampling_time', time.perf_counter() - start_time)
+        loss = scan.calculateLoss(candidates)
+        index = int(np.argmin(loss))
+        if self.best_loss is None or loss[index] < self.best_loss:
+            self.best_loss = loss[index]
+            self.best_datapoint = candidates.select(index)
+            print('[Evaluation %d] Best %s Loss = %f.' % (scan.evaluations, scan.loss_type, self.best_loss))
+        scan.emitProgress('evaluation', self.best_loss, len(loss), max_evaluations=self.max_evaluations)
+        return loss
+
+class cmaesStrategy(optimizerStrategy):
+    def __init__(self, max_evaluations=20000, population_size=None, sigma=0.3, categorical_learning_rate=0.2):
+        super().__init__(max_evaluations)
+        self.population_size = population_size
+        self.sigma = sigma
+        self.categorical_learning_rate = categorical_learning_rate
+
+    def search(self, scan):
+        self.best_loss = None
+        space = searchSpace(scan)
+        random_state = scan.random_state
+        n = space.dimensions
+        lam = self.population_size or max(scan.step_batch_size, 4 + int(3 * np.log(max(n, 1))))
+        mu = lam // 2
+        weights = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+        weights = weights / weights.sum()
+        mueff = 1 / np.sum(weights ** 2)
+
+        cc = (4 + mueff / max(n, 1)) / (n + 4 + 2 * mueff / max(n, 1))
+        cs = (mueff + 2) / (n + mueff + 5)
+        c1 = 2 / ((n + 1.3) ** 2 + mueff)
+        cmu = min(1 - c1, 2 * (mueff - 2 + 1 / mueff) / ((n + 2) ** 2 + mueff))
+        damps = 1 + 2 * max(0, np.sqrt((mueff - 1) / (n + 1)) - 1) + cs
+        chiN = np.sqrt(n) * (1 - 1 / (4.0 * max(n, 1)) + 1 / (21.0 * max(n, 1) ** 2))
+
+        mean = random_state.rand(n)
+        sigma = self.sigma
+        pc = np.zeros(n)
+        ps = np.zeros(n)
+        C = np.eye(n)
+        B = np.eye(n)
+        D = np.ones(n)
+        probabilities = [np.ones(len(options)) / len(options) for options in space.categorical_options]
+        generation = 0
+        while scan.evaluations < self.max_evaluations:
+            z = random_state.randn(lam, n)
+            y = z.dot(np.diag(D)).dot(B.T)
+            unit = np.clip(mean + sigma * y, 0, 1)
+            choices = space.sampleChoices(random_state, lam, probabilities)
+            loss = self.evaluate(scan, space, unit, choices)
+            order = np.argsort(loss)[:mu]
+            generation += 1
+
+            for index, options in enumerate(space.categorical_options):
+                frequency = np.bincount(choices[order, index], weights=weights, minlength=len(options))
+                probabilities[index] = (1 - self.categorical_learning_rate) * probabilities[index] + \
+                    self.categorical_learning_rate * frequency
+                probabilities[index] = np.maximum(probabilities[index], 0.05 / len(options))
+                probabilities[index] = probabilities[index] / probabilities[index].sum()
+
+            if n == 0:
+                continue
+            y_selected = (unit[order] - mean) / sigma
+            y_mean = weights.dot(y_selected)
+            mean = mean + sigma * y_mean
+            C_inverse_sqrt = B.dot(np.diag(1 / D)).dot(B.T)
+            ps = (1 - cs) * ps + np.sqrt(cs * (2 - cs) * mueff) * C_inverse_sqrt.dot(y_mean)
+            hsig = np.linalg.norm(ps) / np.sqrt(1 - (1 - cs) ** (2 * generation)) / chiN < 1.4 + 2 / (n + 1)
+            pc = (1 - cc) * pc + hsig * np.sqrt(cc * (2 - cc) * mueff) * y_mean
+            C = (1 - c1 - cmu) * C + c1 * (np.outer(pc, pc) + (1 - hsig) * cc * (2 - cc) * C) + \
+                cmu * (y_selected.T * weights).dot(y_selected)
+            sigma = min(sigma * np.exp((cs / damps) * (np.linalg.norm(ps) / chiN - 1)), 1.0)
+            C = np.triu(C) + np.triu(C, 1).T
+            D, B = np.linalg.eigh(C)
+            D = np.sqrt(np.maximum(D, 1e-20))
+            if sigma * D.max() < 1e-4:
+                break
+        return self.best_loss, self.best_datapoint
+
+class bayesianStrategy(optimizerStrategy):
+    def __init__(self, max_evaluations=5000, startup_evaluations=200, batch_size=20, candidates=500, gamma=0.15,
+                 max_observations=1000):
+        super().__init__(max_evaluations)
+        self.startup_evaluations = startup_evaluations
+        self.batch_size = batch_size
+        self.candidates = candidates
+        self.gamma = gamma
+        self.max_observations = max_observations
+
+    def logDensity(self, points, centres, bandwidth):
+        if centres.shape[1] == 0:
+            return np.zeros(points.shape[0])
+        distances = ((points[:, np.newaxis, :] - centres[np.newaxis, :, :]) / bandwidth) ** 2
+        log_kernels = -0.5 * distances.sum(axis=2)
+        peak = log_kernels.max(axis=1)
+        return peak + np.log(np.exp(log_kernels - peak[:, np.newaxis]).mean(axis=1)) - np.log(bandwidth).sum()
+
+    def bandwidth(self, centres):
+        if centres.shape[0] < 2:
+            return np.full(centres.shape[1], 0.1)
+        return np.maximum(centres.std(axis=0) * centres.shape[0] ** (-1.0 / (centres.shape[1] + 4)), 0.01)
+
+    def categoricalLogProbability(self, space, choices, observed):
+        log_probability = np.zeros(choices.shape[0])
+        for index, options in enumerate(space.categorical_options):
+            counts = np.bincount(observed[:, index], minlength=len(options)) + 1.0
+            log_probability += np.log(counts / counts.sum())[choices[:, index]]
+        return log_probability
+
+    def search(self, scan):
+        self.best_loss = None
+        space = searchSpace(scan)
+        random_state = scan.random_state
+        unit = random_state.rand(self.startup_evaluations, space.dimensions)
+        choices = space.sampleChoices(random_state, self.startup_evaluations)
+        losses = self.evaluate(scan, space, unit, choices)
+        while scan.evaluations < self.max_evaluations:
+            order = np.argsort(losses)
+            n_good = max(int(np.ceil(self.gamma * len(losses))), 2)
+            good = order[:n_good]
+            bad = order[n_good:]
+            if len(bad) > self.max_observations:
+                bad = random_state.choice(bad, self.max_observations, replace=False)
+
+            good_bandwidth = self.bandwidth(unit[good])
+            bad_bandwidth = self.bandwidth(unit[bad])
+            parents = random_state.choice(good, self.candidates)
+            candidate_unit = np.clip(unit[parents] + random_state.randn(self.candidates, space.dimensions) * good_bandwidth, 0, 1)
+            candidate_choices = np.zeros((self.candidates, len(space.categorical_options)), dtype=int)
+            for index, options in enumerate(space.categorical_options):
+                counts = np.bincount(choices[good, index], minlength=len(options)) + 1.0
+                candidate_choices[:, index] = random_state.choice(len(options), self.candidates, p=counts / counts.sum())
+
+            score = self.logDensity(candidate_unit, unit[good], good_bandwidth) + \
+                self.categoricalLogProbability(space, candidate_choices, choices[good]) - \
+                self.logDensity(candidate_unit, unit[bad], bad_bandwidth) - \
+                self.categoricalLogProbability(space, candidate_choices, choices[bad])
+            selected = np.argsort(-score)[:self.batch_size]
+            batch_loss = self.evaluate(scan, space, candidate_unit[selected], candidate_choices[selected])
+            unit = np.vstack([unit, candidate_unit[selected]])
+            choices = np.vstack([choices, candidate_choices[selected]])
+            losses = np.concatenate([losses, batch_loss])
+        return self.best_loss, self.best_datapoint
+
+def projectComposition(values, lower, upper, fixed_total, max_total=100):
+    projected = np.clip(values, lower, upper)
+    excess = projected.sum(axis=1) + fixed_total - max_total
+    rows = np.flatnonzero(excess > 0)
+    if len(rows):
+        low = np.zeros(len(rows))
+        high = np.full(len(rows), (values[rows] - lower).max(initial=0) + 1)
+        for _ in range(50):
+            shift = (low + high) / 2
+            total = np.clip(values[rows] - shift[:, np.newaxis], lower, upper).sum(axis=1) + fixed_total - max_total
+            low = np.where(total > 0, shift, low)
+            high = np.where(total > 0, high, shift)
+        projected[rows] = np.clip(values[rows] - high[:, np.newaxis], lower, upper)
+    return projected
+
+class gradientStrategy(optimizerStrategy):
+    def __init__(self, steps=200, starts=4, learning_rate=0.02, max_combinations=64, max_evaluations=None):
+        super().__init__(max_evaluations)
+        self.steps = steps
+        self.starts = starts
+        self.learning_rate = learning_rate
+        self.max_combinations = max_combinations
+
+    def enumerateChoices(self, space, random_state):
+        combinations = np.array(list(itertools.product(*[range(len(options)) for options in space.categorical_options])),
+                                dtype=int).reshape(-1, len(space.categorical_options))
+        if len(combinations) > self.max_combinations:
+            combinations = combinations[random_state.choice(len(combinations), self.max_combinations, replace=False)]
+        return np.repeat(combinations, self.starts, axis=0)
+
+    def formatForInput(self, space, categorical_values, values):
+        range_values = np.repeat(space.lower[np.newaxis, :], values.shape[0], axis=0)
+        range_values[:, space.varied] = values
+        return np.column_stack([categorical_values, 100 - range_values.sum(axis=1), range_values])
+
+    def search(self, scan):
+        self.best_loss = None
+        space = searchSpace(scan)
+        random_state = scan.random_state
+        choices = self.enumerateChoices(space, random_state)
+        categorical_values = space.decode(np.zeros((len(choices), space.dimensions)), choices).categorical_values
+        lower = space.lower[space.varied]
+        upper = space.upper[space.varied]
+        width = upper - lower
+        fixed_total = np.delete(space.lower, space.varied).sum()
+        al_column = len(space.categorical_options)
+        range_columns = al_column + 1 + space.varied
+
+        values = projectComposition(lower + random_state.rand(len(choices), space.dimensions) * width,
+                                    lower, upper, fixed_total)
+        first_moment = np.zeros(values.shape)
+        second_moment = np.zeros(values.shape)
+        for step in range(self.steps):
+            if self.max_evaluations is not None and scan.evaluations >= self.max_evaluations:
+                break
+            scan.checkCancelled()
+            start_time = time.perf_counter()
+            loss, gradient = scan.loss_engine.gradient(self.formatForInput(space, categorical_values, values))
+            scan.timer.add('inference_time', time.perf_counter() - start_time)
+            scan.recordEvaluations(loss)
+            scan.emitProgress('gradient_step', loss.min(), len(loss), step=step, max_steps=self.steps)
+            gradient = (gradient[:, range_columns] - gradient[:, [al_column]]) * width
+            first_moment = 0.9 * first_moment + 0.1 * gradient
+            second_moment = 0.999 * second_moment + 0.001 * gradient ** 2
+            update = (first_moment / (1 - 0.9 ** (step + 1))) / (np.sqrt(second_moment / (1 - 0.999 ** (step + 1))) + 1e-8)
+            values = projectComposition(values - self.learning_rate * update * width, lower, upper, fixed_total)
+            if step % 20 == 0:
+                print('[Gradient Step %d] Best %s Loss = %f.' % (step, scan.loss_type, loss.min()))
+
+        unit = np.divide(values - lower, width, out=np.zeros(values.shape), where=width > 0)
+        self.evaluate(scan, space, unit, choices)
+        return self.best_loss, self.best_datapoint
+
+strategies = {
+    'random_walk': randomWalkStrategy,
+    'cmaes': cmaesStrategy,
+    'bayesian': bayesianStrategy,
+    'gradient': gradientStrategy
+}
+
+def compareStrategies(settings, models, target_loss, names=None, seeds=(0, 1, 2)):
+    results = {}
+    for name in names or strategies.keys():
+        results[name] = []
+        for seed in seeds:
+            scan = compositionScan(settings, models, seed=seed, strategy=strategies[name]())
+            with redirect_stdout(io.StringIO()):
+                best_loss, best_datapoint = scan.search()
+            results[name].append((scan.evaluationsToLoss(target_loss), float(best_loss), scan.evaluations))
+    print('==========Strategy Comparison (target %s Loss = %f)==========' % (settings.loss_type, target_loss))
+    for name, runs in results.items():
+        reached = [evaluations for evaluations, loss, total in runs if evaluations is not None]
+        print('%s: reached target in %d/%d runs, median evaluations to target = %s, median final loss = %f, '
+              'median total evaluations = %d' %
+              (name, len(reached), len(runs), str(int(np.median(reached))) if reached else 'n/a',
+               np.median([loss for evaluations, loss, total in runs]),
+               np.median([total for evaluations, loss, total in runs])))
+    return results
@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+import io
+import time
+from contextlib import redirect_stdout
+from multiprocessing import Pool
+
+import numpy as np
+
+from src.CompositionScan import compositionScan
+from src.ModelRegistry import registry
+from src.Optimizers import strategies
+
+worker_models = None
+
+def initWorker(model_paths, mode):
+    global worker_models
+    worker_models = registry.getModels(model_paths, mode)
+
+def runChain(arguments):
+    settings, seed, strategy = arguments
+    strategy = strategies[strategy]() if strategy is not None else None
+    with redirect_stdout(io.StringIO()):
+        best_loss, best_datapoint = compositionScan(settings, worker_models, seed=seed, strategy=strategy).search()
+    return seed, float(best_loss), best_datapoint
+
+class multiStartScan:
+    def __init__(self, settings, model_paths, restarts=8, seed=0, processes=None, top=5, strategy=None):
+        self.settings = settings
+        self.model_paths = model_paths
+        self.restarts = restarts
+        self.seed = seed
+        self.processes = processes
+        self.top = top
+        self.strategy = strategy
+        self.results = []
+
+    def getSeeds(self):
+        return [self.seed + index for index in range(self.restarts)]
+
+    def mergeResults(self, chains):
+        ranked = []
+        seen = set()
+        for seed, loss, datapoint in sorted(chains, key=lambda chain: (chain[1], chain[0])):
+            key = np.round(datapoint.formatForInput()[0], 2).tobytes()
+            if key in seen:
+                continue
+            seen.add(key)
+            ranked.append((loss, seed, datapoint))
+        return ranked[:self.top]
+
+    def run(self):
+        start_time = time.perf_counter()
+        arguments = [(self.settings, seed, self.strategy) for seed in self.getSeeds()]
+        with Pool(self.processes, initializer=initWorker, initargs=(self.model_paths, self.settings.mode)) as pool:
+            chains = pool.map(runChain, arguments)
+        self.results = self.mergeResults(chains)
+        print('==========Scan Finished==========')
+        print('%d chains finished in %.1fs, %d distinct best compositions' %
+              (len(chains), time.perf_counter() - start_time, len(self.results)))
+        scan = compositionScan(self.settings, registry.getModels(self.model_paths, self.settings.mode))
+        for rank, (loss, seed, datapoint) in enumerate(self.results):
+            print('[Rank %d] %s Loss = %f (seed %d)' % (rank + 1, self.settings.loss_type, loss, seed))
+            scan.printResults(datapoint.getDatapoint())
+        return self.results
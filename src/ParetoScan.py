@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+import csv
+import time
+import numpy as np
+
+from src.CompositionScan import compositionScan, AlPopulation
+from src.Optimizers import searchSpace
+
+def dominatedBy(points, by, block_size=1024):
+    dominated = np.zeros(points.shape[0], dtype=bool)
+    for start in range(0, points.shape[0], block_size):
+        block = points[start:start + block_size]
+        no_worse = np.ones((by.shape[0], block.shape[0]), dtype=bool)
+        better = np.zeros((by.shape[0], block.shape[0]), dtype=bool)
+        for column in range(points.shape[1]):
+            no_worse &= by[:, [column]] <= block[np.newaxis, :, column]
+            better |= by[:, [column]] < block[np.newaxis, :, column]
+        dominated[start:start + block_size] = (no_worse & better).any(axis=0)
+    return dominated
+
+def nonDominatedMask(objectives):
+    return ~dominatedBy(objectives, objectives)
+
+def crowdingDistance(objectives):
+    distance = np.zeros(objectives.shape[0])
+    if objectives.shape[0] < 3:
+        return np.full(objectives.shape[0], np.inf)
+    for column in range(objectives.shape[1]):
+        order = np.argsort(objectives[:, column])
+        spread = objectives[order[-1], column] - objectives[order[0], column]
+        distance[order[0]] = distance[order[-1]] = np.inf
+        if spread > 0:
+            distance[order[1:-1]] += (objectives[order[2:], column] - objectives[order[:-2], column]) / spread
+    return distance
+
+class paretoScan(compositionScan):
+    def __init__(self, settings, models, seed=None, cache_size=50000, generations=200, batch_size=500,
+                 archive_size=1000, directions=None):
+        super().__init__(settings, models, seed, cache_size)
+        if self.mode != 'Mechanical':
+            raise ValueError('Pareto scans need the Mechanical models')
+        self.generations = generations
+        self.batch_size = batch_size
+        self.archive_size = archive_size
+        self.directions = directions or {
+            'elongation%': 'max',
+            'tensile strength(MPa)': 'max',
+            'yield strength(MPa)': 'max'
+        }
+        self.properties = list(self.directions.keys())
+        self.front = None
+        self.front_predictions = None
+
+    def getObjectives(self, predictions):
+        return np.column_stack([-predictions[key] if self.directions[key] == 'max' else predictions[key]
+                                for key in self.properties])
+
+    def mutate(self, space, unit, choices, std):
+        unit = np.clip(unit + self.random_state.randn(*unit.shape) * std, 0, 1)
+        choices = choices.copy()
+        for index, options in enumerate(space.categorical_options):
+            resample = self.random_state.rand(choices.shape[0]) < 0.1
+            choices[resample, index] = self.random_state.choice(len(options), int(resample.sum()))
+        return unit, choices
+
+    def encode(self, space, population):
+        width = space.upper[space.varied] - space.lower[space.varied]
+        unit = (population.range_based_values[:, space.varied] - space.lower[space.varied]) / width
+        choices = np.column_stack([np.argmax(population.categorical_values[:, [index]] == options[np.newaxis, :], axis=1)
+                                   for index, options in enumerate(space.categorical_options)])
+        return unit, choices
+
+    def updateArchive(self, archive, archive_predictions, candidates, predictions):
+        archive_size = 0
+        if archive is not None:
+            archive_size = len(archive)
+            candidates = AlPopulation(candidates.categorical_keys, candidates.range_based_keys,
+                                      np.vstack([archive.categorical_values, candidates.categorical_values]),
+                                      np.vstack([archive.range_based_values, candidates.range_based_values]))
+            predictions = {key: np.concatenate([archive_predictions[key], predictions[key]]) for key in self.properties}
+        inputs = np.round(candidates.formatForInput(), 2)
+        unique = np.sort(np.unique(inputs, axis=0, return_index=True)[1])
+        objectives = self.getObjectives(predictions)[unique]
+        new = unique >= archive_size
+        survivors = ~dominatedBy(objectives[new], objectives)
+        new_objectives = objectives[new][survivors]
+        keep = np.concatenate([unique[~new][~dominatedBy(objectives[~new], new_objectives)], unique[new][survivors]])
+        if len(keep) > self.archive_size:
+            distance = crowdingDistance(self.getObjectives(predictions)[keep])
+            keep = keep[np.argsort(-distance)[:self.archive_size]]
+        return candidates.select(keep), {key: predictions[key][keep] for key in self.properties}
+
+    def search(self):
+        space = searchSpace(self)
+        self.setPhase('pareto')
+        unit = self.random_state.rand(self.batch_size, space.dimensions)
+        choices = space.sampleChoices(self.random_state, self.batch_size)
+        archive = None
+        archive_predictions = None
+        self.emit('start', mode=self.mode, generations=self.generations, strategy='pareto')
+        for generation in range(self.generations):
+            self.checkCancelled()
+            start_time = time.perf_counter()
+            candidates = space.decode(unit, choices)
+            inference_time = time.perf_counter()
+            predictions = self.loss_engine.predict(candidates.formatForInput(), self.properties)
+            self.evaluations += len(candidates)
+            archive_time = time.perf_counter()
+            archive, archive_predictions = self.updateArchive(archive, archive_predictions, candidates, predictions)
+            self.timer.add('sampling_time', inference_time - start_time)
+            self.timer.add('inference_time', archive_time - inference_time)
+            self.timer.add('loss_time', time.perf_counter() - archive_time)
+            if self.callbacks:
+                self.emit('generation', phase=self.phase, step=generation, max_steps=self.generations,
+                          front_size=len(archive), evaluated=len(candidates), evaluations=self.evaluations,
+                          **self.timer.delta())
+            if generation % 20 == 0:
+                print('[Generation %d] Pareto front size = %d.' % (generation, len(archive)))
+            parent_unit, parent_choices = self.encode(space, archive)
+            parents = self.random_state.choice(len(archive), self.batch_size)
+            std = 0.2 * (1 - generation / float(self.generations)) + 0.01
+            unit, choices = self.mutate(space, parent_unit[parents], parent_choices[parents], std)
+        self.front = archive
+        self.front_predictions = archive_predictions
+        self.emit('finish', front_size=len(archive), evaluations=self.evaluations, **self.timer.totals)
+        return archive, archive_predictions
+
+    def run(self):
+        self.search()
+        print('==========Scan Finished==========')
+        print('Pareto front of %d compositions from %d evaluations' % (len(self.front), self.evaluations))
+        for key in self.properties:
+            print('%s: %f to %f' % (key, self.front_predictions[key].min(), self.front_predictions[key].max()))
+        return self.front, self.front_predictions
+
+    def exportCSV(self, output_path):
+        order = np.argsort(-self.front_predictions[self.properties[0]])
+        with open(output_path, 'w', newline='') as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow([*self.front.categorical_keys, 'Al%', *self.front.range_based_keys, *self.properties])
+            rows = np.column_stack([self.front.formatForInput(), *[self.front_predictions[key] for key in self.properties]])
+            for row in rows[order]:
+                writer.writerow(['%g' % value for value in np.round(row, 4)])
+        print('Pareto front saved to: ' + output_path)
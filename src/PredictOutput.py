@@ -1,33 +1,117 @@
 #!/usr/bin/python3
 
+import os
+import time
 import numpy as np
 import csv
 
-class predictOutput:
-    def __init__(self, dataset_path, models, mode):
+from src.CompositionScan import lossEngine
+from src.Instrumentation import eventEmitter, cancellable, phaseTimer
+
+class predictOutput(eventEmitter, cancellable):
+    def __init__(self, dataset_path, models, mode, output_path=None, chunk_size=10000, store=None):
         self.mode = mode
         self.models = models
         self.dataset_path = dataset_path
+        self.output_path = output_path
+        self.chunk_size = chunk_size
+        self.loss_engine = lossEngine(self.models, self.mode, {}, None, store, return_std=True)
+        self.timer = phaseTimer()
+        self.callbacks = []
+        self.cancel_event = None
         self.dataset = []
-        with open(self.dataset_path, "r") as csv_file:
-            csv_reader = csv.reader(csv_file, delimiter=',')
-            next(csv_reader)
-            for lines in csv_reader:
-                self.dataset.append(lines)
-        self.dataset = np.asarray(self.dataset)
+        if self.output_path is None:
+            with open(self.dataset_path, "r") as csv_file:
+                csv_reader = csv.reader(csv_file, delimiter=',')
+                next(csv_reader)
+                for lines in csv_reader:
+                    if any(value.strip() for value in lines):
+                        self.dataset.append(lines)
+            self.dataset = np.asarray(self.dataset)
 
     def predict(self, index, datapoint):
+        predictions = self.loss_engine.predict(np.reshape(datapoint, (1, -1)).astype(float))
         if self.mode == 'DoS':
-            prediction = round(self.models['DoS'].predict(np.reshape(datapoint, (1, -1)))[0][0], 2)
+            prediction = round(float(predictions['DoS'][0]), 2)
             print(str(index) + ': DoS=' + str(prediction))
         elif self.mode == 'Mechanical':
-            prediction_1 = round(self.models['elongation'].predict(np.reshape(datapoint, (1, -1)))[0][0], 2)
-            prediction_2 = round(self.models['tensile'].predict(np.reshape(datapoint, (1, -1)))[0][0], 2)
-            prediction_3 = round(self.models['yield'].predict(np.reshape(datapoint, (1, -1)))[0][0], 2)
+            prediction_1 = round(float(predictions['elongation%'][0]), 2)
+            prediction_2 = round(float(predictions['tensile strength(MPa)'][0]), 2)
+            prediction_3 = round(float(predictions['yield strength(MPa)'][0]), 2)
 
             print(str(index) + ': elongation%=' + str(prediction_1) + ' tensile(MPa)=' + str(prediction_2) +
                   ' yield(MPa)=' + str(prediction_3))
 
+    def readChunks(self):
+        with open(self.dataset_path, "r") as csv_file:
+            csv_reader = csv.reader(csv_file, delimiter=',')
+            next(csv_reader)
+            width = None
+            while True:
+                rows = []
+                for row in csv_reader:
+                    if not any(value.strip() for value in row):
+                        continue
+                    if width is None:
+                        width = len(row)
+                    try:
+                        if len(row) != width:
+                            raise ValueError('expected %d columns, found %d' % (width, len(row)))
+                        rows.append([float(value) for value in row])
+                    except ValueError as error:
+                        raise ValueError('%s line %d: %s' % (self.dataset_path, csv_reader.line_num, error))
+                    if len(rows) == self.chunk_size:
+                        break
+                if not rows:
+                    break
+                yield np.asarray(rows)
+
+    def runStreaming(self):
+        properties = list(self.loss_engine.outputs.keys())
+        properties += [key + ' std' for key in properties if self.loss_engine.hasStd(key)]
+        start_time = time.perf_counter()
+        temporary_path = self.output_path + '.tmp'
+        try:
+            rows = self.writePredictions(temporary_path, properties, start_time)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        os.replace(temporary_path, self.output_path)
+        self.emit('finish', rows=rows, elapsed=time.perf_counter() - start_time, **self.timer.totals)
+        print('Predictions saved to: ' + self.output_path)
+
+    def writePredictions(self, output_path, properties, start_time):
+        rows = 0
+        with open(output_path, "w", newline='') as output_file:
+            csv.writer(output_file).writerow(['row', *properties])
+            read_time = time.perf_counter()
+            for chunk in self.readChunks():
+                self.checkCancelled()
+                inference_time = time.perf_counter()
+                predictions = self.loss_engine.predict(chunk)
+                write_time = time.perf_counter()
+                np.savetxt(output_file,
+                           np.column_stack([np.arange(rows, rows + chunk.shape[0]), *[predictions[key] for key in properties]]),
+                           fmt=['%d'] + ['%.2f'] * len(properties), delimiter=',')
+                rows += chunk.shape[0]
+                self.timer.add('io_time', inference_time - read_time + time.perf_counter() - write_time)
+                self.timer.add('inference_time', write_time - inference_time)
+                rows_per_second = rows / max(time.perf_counter() - start_time, 1e-9)
+                print('[Predict] %d rows at %.0f rows/sec' % (rows, rows_per_second))
+                self.emit('chunk', phase='predict', rows=rows, evaluated=chunk.shape[0], rows_per_second=rows_per_second,
+                          **self.timer.delta())
+                read_time = time.perf_counter()
+        return rows
+
     def run(self):
+        if self.output_path is not None:
+            self.runStreaming()
+            return
         for i in range(self.dataset.shape[0]):
+            self.checkCancelled()
+            start_time = time.perf_counter()
             self.predict(i, self.dataset[i])
+            self.timer.add('inference_time', time.perf_counter() - start_time)
+            self.emit('row', phase='predict', rows=i + 1, total_rows=self.dataset.shape[0], evaluated=1, **self.timer.delta())
+        self.emit('finish', rows=self.dataset.shape[0], **self.timer.totals)
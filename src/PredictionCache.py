@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+from collections import OrderedDict
+import numpy as np
+
+class predictionCache:
+    def __init__(self, max_size=50000, decimals=4, backend=None):
+        self.max_size = max_size
+        self.decimals = decimals
+        self.backend = backend
+        self.entries = OrderedDict()
+        self.phase = 'default'
+        self.stats = OrderedDict()
+
+    def setPhase(self, phase):
+        self.phase = phase
+        if self.backend is not None:
+            self.backend.setPhase(phase)
+
+    def record(self, hits, misses):
+        phase_stats = self.stats.setdefault(self.phase, [0, 0])
+        phase_stats[0] += hits
+        phase_stats[1] += misses
+
+    def predict(self, model_key, model, inputs, **options):
+        quantized = np.round(np.asarray(inputs, dtype=float), self.decimals) + 0.0
+        unique_rows, inverse = np.unique(quantized, axis=0, return_inverse=True)
+        inverse = np.ravel(inverse)
+        keys = [(model_key, row.tobytes()) for row in unique_rows]
+        outputs = [None] * len(keys)
+        missing = []
+        for index, key in enumerate(keys):
+            output = self.entries.get(key)
+            if output is None:
+                missing.append(index)
+            else:
+                self.entries.move_to_end(key)
+                outputs[index] = output
+        if missing:
+            if self.backend is not None:
+                predicted = self.backend.predict(model_key, model, unique_rows[missing], **options)
+            else:
+                predicted = np.reshape(model.predict(unique_rows[missing], batch_size=len(missing), **options),
+                                       (len(missing), -1))
+            for row, index in enumerate(missing):
+                outputs[index] = predicted[row]
+                self.entries[keys[index]] = predicted[row]
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        self.record(quantized.shape[0] - len(missing), len(missing))
+        return np.stack(outputs)[inverse]
+
+    def getHitRates(self):
+        return OrderedDict((phase, hits / float(max(hits + misses, 1)))
+                           for phase, (hits, misses) in self.stats.items())
+
+    def printStats(self):
+        for phase, (hits, misses) in self.stats.items():
+            print('[Cache] %s: %.1f%% hit rate (%d hits, %d model evaluations)' %
+                  (phase, 100 * hits / float(max(hits + misses, 1)), hits, misses))
+        if self.backend is not None:
+            self.backend.printStats()
@@ -0,0 +1,240 @@
+#!/usr/bin/python3
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.CompositionScan import lossEngine
+from src.ModelRegistry import registry, default_model_paths, mode_models
+
+input_dims = {
+    'DoS': 21,
+    'Mechanical': 26
+}
+
+def getRunningLoop():
+    if sys.version_info >= (3, 7):
+        return asyncio.get_running_loop()
+    return asyncio.get_event_loop()
+
+status_messages = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+class serviceStats:
+    def __init__(self, window=10000):
+        self.start_time = time.time()
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.batch_rows = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=window)
+
+    def recordRequest(self, rows, latency):
+        self.requests += 1
+        self.rows += rows
+        self.latencies.append(latency)
+
+    def recordBatch(self, rows):
+        self.batches += 1
+        self.batch_rows += rows
+
+    def getSummary(self):
+        elapsed = max(time.time() - self.start_time, 1e-9)
+        summary = {'requests': self.requests, 'rows': self.rows, 'batches': self.batches, 'errors': self.errors,
+                   'mean_batch_rows': self.batch_rows / float(max(self.batches, 1)),
+                   'requests_per_second': self.requests / elapsed, 'rows_per_second': self.rows / elapsed}
+        if self.latencies:
+            for percentile, value in zip([50, 90, 99], np.percentile(list(self.latencies), [50, 90, 99])):
+                summary['p%d_ms' % percentile] = value * 1000
+        return summary
+
+class microBatcher:
+    def __init__(self, loss_engine, executor, stats, max_batch_size=256, max_wait=0.005):
+        self.loss_engine = loss_engine
+        self.executor = executor
+        self.stats = stats
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = None
+
+    async def predict(self, inputs):
+        future = getRunningLoop().create_future()
+        await self.queue.put((inputs, future))
+        return await future
+
+    async def collect(self):
+        loop = getRunningLoop()
+        items = [await self.queue.get()]
+        rows = items[0][0].shape[0]
+        deadline = loop.time() + self.max_wait
+        while rows < self.max_batch_size:
+            if self.queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self.queue.get_nowait()
+            items.append(item)
+            rows += item[0].shape[0]
+        return items
+
+    async def run(self):
+        loop = getRunningLoop()
+        while True:
+            items = await self.collect()
+            inputs = np.vstack([item_inputs for item_inputs, future in items])
+            try:
+                predictions = await loop.run_in_executor(self.executor, self.loss_engine.predict, inputs)
+            except Exception as error:
+                for item_inputs, future in items:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.stats.recordBatch(inputs.shape[0])
+            start = 0
+            for item_inputs, future in items:
+                end = start + item_inputs.shape[0]
+                if not future.done():
+                    future.set_result({key: np.round(values[start:end].astype(float), 4).tolist()
+                                       for key, values in predictions.items()})
+                start = end
+
+class predictionService:
+    def __init__(self, models, max_batch_size=256, max_wait=0.005):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.stats = {}
+        self.batchers = {}
+        for mode, models_for_mode in models.items():
+            self.stats[mode] = serviceStats()
+            self.batchers[mode] = microBatcher(lossEngine(models_for_mode, mode, {}, None, return_std=True), self.executor,
+                                               self.stats[mode], max_batch_size, max_wait)
+        self.server = None
+        self.tasks = []
+
+    def parseInputs(self, mode, body):
+        request = json.loads(body.decode('utf-8'))
+        single = 'input' in request
+        inputs = np.asarray(request['input'] if single else request['inputs'], dtype=float)
+        inputs = inputs.reshape(1, -1) if single else inputs
+        if inputs.ndim != 2 or inputs.shape[1] != input_dims[mode]:
+            raise ValueError('%s requests need rows of %d inputs' % (mode, input_dims[mode]))
+        return inputs, single
+
+    async def handlePredict(self, mode, body):
+        start_time = time.perf_counter()
+        inputs, single = self.parseInputs(mode, body)
+        predictions = await self.batchers[mode].predict(inputs)
+        if single:
+            predictions = {key: values[0] for key, values in predictions.items()}
+        self.stats[mode].recordRequest(inputs.shape[0], time.perf_counter() - start_time)
+        return 200, {'mode': mode, 'predictions': predictions}
+
+    async def route(self, method, path, body):
+        parts = path.strip('/').split('/')
+        if parts == ['health']:
+            return 200, {'status': 'ok', 'modes': list(self.batchers.keys())}
+        if parts == ['stats']:
+            return 200, dict((mode, stats.getSummary()) for mode, stats in self.stats.items())
+        if len(parts) == 2 and parts[0] == 'predict' and parts[1] in self.batchers:
+            if method != 'POST':
+                return 405, {'error': 'Use POST with a JSON body'}
+            try:
+                return await self.handlePredict(parts[1], body)
+            except (ValueError, KeyError, TypeError) as error:
+                self.stats[parts[1]].errors += 1
+                return 400, {'error': '%s: %s' % (type(error).__name__, error)}
+        return 404, {'error': 'Unknown path: ' + path}
+
+    async def handleConnection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, value = line.decode('latin-1').split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                try:
+                    status, response = await self.route(method, path, body)
+                except Exception as error:
+                    status, response = 500, {'error': '%s: %s' % (type(error).__name__, error)}
+                payload = json.dumps(response).encode('utf-8')
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                writer.write(('HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n'
+                              'Connection: %s\r\n\r\n' % (status, status_messages[status], len(payload),
+                                                          'keep-alive' if keep_alive else 'close')).encode('latin-1'))
+                writer.write(payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8765, unix_path=None):
+        for batcher in self.batchers.values():
+            batcher.queue = asyncio.Queue()
+            self.tasks.append(asyncio.ensure_future(batcher.run()))
+        if unix_path is not None:
+            if os.path.exists(unix_path):
+                os.remove(unix_path)
+            self.server = await asyncio.start_unix_server(self.handleConnection, unix_path)
+            print('Serving predictions on unix socket ' + unix_path)
+        else:
+            self.server = await asyncio.start_server(self.handleConnection, host, port)
+            print('Serving predictions on http://%s:%d' % (host, self.server.sockets[0].getsockname()[1]))
+
+    def serveForever(self, host='127.0.0.1', port=8765, unix_path=None):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(self.start(host, port, unix_path))
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server.close()
+            loop.run_until_complete(self.server.wait_closed())
+            for task in self.tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*self.tasks, return_exceptions=True))
+            loop.close()
+            self.executor.shutdown()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m src.PredictionService',
+                                     description='Serve DoS and Mechanical predictions over HTTP with micro-batching.')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='TCP port to listen on')
+    parser.add_argument('--unix', help='Listen on this Unix socket instead of TCP')
+    parser.add_argument('--models', help='JSON file of model paths by name, overriding the bundled models')
+    parser.add_argument('--max-batch-size', type=int, default=256, help='Rows collected into one forward pass')
+    parser.add_argument('--max-wait-ms', type=float, default=5.0, help='Longest a request waits for a batch to fill')
+    args = parser.parse_args(argv)
+
+    model_paths = dict(default_model_paths)
+    if args.models:
+        with open(args.models, 'r') as models_file:
+            model_paths.update(json.load(models_file))
+    models = dict((mode, registry.getModels(model_paths, mode)) for mode in mode_models.keys())
+    predictionService(models, args.max_batch_size, args.max_wait_ms / 1000.0).serveForever(args.host, args.port, args.unix)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/python3
+import csv
+import time
+import itertools
+from multiprocessing import Pool
+
+import numpy as np
+
+from src.CompositionScan import scanSettings, compositionScan
+from src.ModelRegistry import registry
+from src.Optimizers import searchSpace
+
+worker_scan = None
+
+def initWorker(settings, model_paths, options):
+    global worker_scan
+    worker_scan = screeningScan(settings, registry.getModels(model_paths, settings.mode), **options)
+
+def evaluateChunk(arguments):
+    start, stop, edges = arguments
+    return worker_scan.evaluateChunk(start, stop, edges)
+
+class screeningScan(compositionScan):
+    def __init__(self, settings, models, seed=None, samples=100000, sampler='lhs', chunk_size=20000, top=100,
+                 histogram_bins=50, processes=1, model_paths=None):
+        super().__init__(settings, models, seed, cache_size=0)
+        self.seed = 0 if seed is None else seed
+        self.space = searchSpace(self)
+        self.samples = samples if self.space.dimensions else 1
+        self.sampler = sampler
+        if self.sampler == 'sobol':
+            try:
+                from scipy.stats import qmc
+            except ImportError:
+                print('scipy.stats.qmc is not available, using Latin hypercube sampling instead of Sobol')
+                self.sampler = 'lhs'
+        self.combinations = np.asarray(list(itertools.product(*[range(len(options))
+                                                                  for options in self.space.categorical_options])),
+                                       dtype=int).reshape(-1, len(self.space.categorical_options))
+        self.chunk_samples = max(chunk_size // len(self.combinations), 1)
+        if self.sampler == 'sobol':
+            self.chunk_samples = 2 ** int(np.log2(self.chunk_samples))
+        self.top = top
+        self.histogram_bins = histogram_bins
+        self.processes = processes
+        self.model_paths = model_paths
+        self.properties = list(self.loss_engine.outputs.keys())
+        self.top_loss = None
+        self.top_index = None
+        self.top_inputs = None
+        self.top_predictions = None
+        self.histograms = None
+        self.strata = None
+
+    def getOptions(self):
+        return {'seed': self.seed, 'samples': self.samples, 'sampler': self.sampler, 'top': self.top,
+                'chunk_size': self.chunk_samples * len(self.combinations), 'histogram_bins': self.histogram_bins}
+
+    def sampleUnit(self, start, stop):
+        dimensions = self.space.dimensions
+        if dimensions == 0:
+            return np.zeros((stop - start, 0))
+        if self.sampler == 'sobol':
+            from scipy.stats import qmc
+            sampler = qmc.Sobol(dimensions, scramble=True, seed=self.seed)
+            if start:
+                sampler.fast_forward(start)
+            return sampler.random(stop - start)
+        if self.strata is None:
+            self.strata = np.column_stack([np.random.RandomState([self.seed, dimension]).permutation(self.samples)
+                                           for dimension in range(dimensions)]).astype(np.int32)
+        jitter = np.random.RandomState([self.seed, start]).rand(stop - start, dimensions)
+        return (self.strata[start:stop] + jitter) / self.samples
+
+    def selectTop(self, loss, index, inputs, predictions):
+        order = np.lexsort((index, loss))
+        first = np.unique(inputs[order], axis=0, return_index=True)[1]
+        keep = order[np.sort(first)[:self.top]]
+        return loss[keep], index[keep], inputs[keep], {key: values[keep] for key, values in predictions.items()}
+
+    def mergeTop(self, current, chunk):
+        if current is None:
+            return chunk
+        return self.selectTop(np.concatenate([current[0], chunk[0]]), np.concatenate([current[1], chunk[1]]),
+                              np.vstack([current[2], chunk[2]]),
+                              {key: np.concatenate([current[3][key], chunk[3][key]]) for key in current[3].keys()})
+
+    def getEdges(self, loss, predictions):
+        edges = {}
+        for key, values in [('loss', loss)] + [(key, predictions[key]) for key in self.properties]:
+            low, high = float(np.min(values)), float(np.max(values))
+            margin = max((high - low) * 0.1, 1e-6)
+            edges[key] = np.concatenate([[-np.inf], np.linspace(low - margin, high + margin, self.histogram_bins + 1),
+                                         [np.inf]])
+        return edges
+
+    def evaluateChunk(self, start, stop, edges=None):
+        start_time = time.perf_counter()
+        unit = self.sampleUnit(start, stop)
+        size = stop - start
+        choices = np.repeat(self.combinations, size, axis=0)
+        index = (np.arange(len(self.combinations))[:, np.newaxis] * self.samples +
+                 np.arange(start, stop)[np.newaxis, :]).ravel()
+        inputs = self.space.decode(np.tile(unit, (len(self.combinations), 1)), choices).formatForInput()
+        inference_time = time.perf_counter()
+        predictions = self.loss_engine.predict(inputs, self.properties)
+        loss_time = time.perf_counter()
+        loss = self.loss_engine.calculateLoss(predictions)
+        timings = {'sampling_time': inference_time - start_time, 'inference_time': loss_time - inference_time,
+                   'loss_time': time.perf_counter() - loss_time}
+        if edges is None:
+            edges = self.getEdges(loss, predictions)
+        histograms = {}
+        for key, values in [('loss', loss)] + [(key, predictions[key]) for key in self.properties]:
+            histograms[key] = np.histogram(values, edges[key])[0]
+        return self.selectTop(loss, index, inputs, predictions), histograms, edges, len(loss), timings
+
+    def getChunks(self):
+        return [(start, min(start + self.chunk_samples, self.samples))
+                for start in range(0, self.samples, self.chunk_samples)]
+
+    def collect(self, result, chunk_index, chunks):
+        top, histograms, edges, evaluated, timings = result
+        self.evaluations += evaluated
+        for key, elapsed in timings.items():
+            self.timer.add(key, elapsed)
+        self.top_loss, self.top_index, self.top_inputs, self.top_predictions = self.mergeTop(
+            None if self.top_loss is None else (self.top_loss, self.top_index, self.top_inputs, self.top_predictions), top)
+        if self.histograms is None:
+            self.histograms = dict((key, (np.zeros(len(edges[key]) - 1, dtype=np.int64), edges[key])) for key in histograms)
+        for key, counts in histograms.items():
+            self.histograms[key][0][:] += counts
+        self.emitProgress('step', self.top_loss[0], evaluated, step=chunk_index, max_steps=len(chunks))
+        if chunk_index % 10 == 0 or chunk_index == len(chunks) - 1:
+            print('[Chunk %d/%d] %d candidates, best %s Loss = %f.' %
+                  (chunk_index + 1, len(chunks), self.evaluations, self.loss_type, self.top_loss[0]))
+
+    def search(self):
+        self.setPhase('screen')
+        self.evaluations = 0
+        self.top_loss = self.histograms = None
+        chunks = self.getChunks()
+        total = self.samples * len(self.combinations)
+        self.emit('start', mode=self.mode, candidates=total, chunks=len(chunks), strategy='screen')
+        print('Screening %d candidates (%d categorical combinations x %d %s samples) in %d chunks' %
+              (total, len(self.combinations), self.samples, self.sampler, len(chunks)))
+        first = self.evaluateChunk(*chunks[0])
+        edges = first[2]
+        self.collect(first, 0, chunks)
+        arguments = [(start, stop, edges) for start, stop in chunks[1:]]
+        if self.processes == 1 or self.model_paths is None or not arguments:
+            self.collectAll((self.evaluateChunk(*argument) for argument in arguments), chunks)
+        else:
+            with Pool(self.processes, initializer=initWorker,
+                      initargs=(self.getSettings(), self.model_paths, self.getOptions())) as pool:
+                self.collectAll(pool.imap_unordered(evaluateChunk, arguments), chunks)
+        self.emit('finish', best_loss=float(self.top_loss[0]), evaluations=self.evaluations, **self.timer.totals)
+        return self.top_loss, self.top_inputs
+
+    def collectAll(self, results, chunks):
+        for chunk_index, result in enumerate(results, 1):
+            self.checkCancelled()
+            self.collect(result, chunk_index, chunks)
+
+    def getSettings(self):
+        settings = scanSettings(self.mode)
+        settings.loss_type = self.loss_type
+        settings.targets = self.targets
+        settings.max_steps = self.max_steps
+        settings.categorical_inputs = self.categorical_inputs
+        settings.range_based_inputs = self.range_based_inputs
+        settings.uncertainty_weight = self.uncertainty_weight
+        return settings
+
+    def run(self, shown=5):
+        self.search()
+        print('==========Scan Finished==========')
+        print('Screened %d candidates, kept the best %d' % (self.evaluations, len(self.top_loss)))
+        for key, (counts, edges) in self.histograms.items():
+            peak = int(np.argmax(counts[1:-1])) + 1
+            print('%s: %f to %f, most candidates between %f and %f' %
+                  (key, edges[1], edges[-2], edges[peak], edges[peak + 1]))
+            if counts[0] or counts[-1]:
+                print('  %d below and %d above the range of the first chunk' % (counts[0], counts[-1]))
+        keys = [*self.space.categorical_keys, 'Al%', *self.space.range_based_keys]
+        for rank in range(min(shown, len(self.top_loss))):
+            print('[Rank %d] %s Loss = %f' % (rank + 1, self.loss_type, self.top_loss[rank]))
+            print(', '.join('%s %g' % (key, round(value, 2)) for key, value in zip(keys, self.top_inputs[rank])
+                            if value or key == 'Al%'))
+        return self.top_loss, self.top_inputs
+
+    def exportCSV(self, output_path):
+        with open(output_path, 'w', newline='') as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow([*self.space.categorical_keys, 'Al%', *self.space.range_based_keys, *self.properties, 'loss'])
+            rows = np.column_stack([self.top_inputs, *[self.top_predictions[key] for key in self.properties],
+                                    self.top_loss])
+            for row in rows:
+                writer.writerow(['%g' % value for value in np.round(row, 4)])
+        with open(output_path.rsplit('.', 1)[0] + '_histograms.csv', 'w', newline='') as histogram_file:
+            writer = csv.writer(histogram_file)
+            writer.writerow(['quantity', 'bin_start', 'bin_end', 'count'])
+            for key, (counts, edges) in self.histograms.items():
+                for count, low, high in zip(counts, edges[:-1], edges[1:]):
+                    writer.writerow([key, '%g' % low, '%g' % high, int(count)])
+        print('Screening results saved to: ' + output_path)
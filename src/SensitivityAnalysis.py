@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+import csv
+import time
+import numpy as np
+
+from src.CompositionScan import lossEngine
+from src.Optimizers import searchSpace
+
+class sensitivityAnalysis:
+    def __init__(self, scan, samples=1024, step=0.01, batch_size=100000, seed=0):
+        self.scan = scan
+        self.space = searchSpace(scan)
+        self.samples = samples
+        self.step = step
+        self.batch_size = batch_size
+        self.seed = seed
+        self.loss_engine = lossEngine(scan.models, scan.mode, scan.targets, scan.loss_type, None, scan.uncertainty_weight)
+        self.properties = list(self.loss_engine.outputs.keys())
+        self.categorical_factors = [index for index, options in enumerate(self.space.categorical_options) if len(options) > 1]
+        self.factors = ([self.space.categorical_keys[index] for index in self.categorical_factors] +
+                        [self.space.range_based_keys[index] for index in self.space.varied])
+        self.first_order = None
+        self.total = None
+        self.jacobian = None
+
+    def sampleUnit(self, dimensions):
+        try:
+            from scipy.stats import qmc
+        except ImportError:
+            return np.random.RandomState(self.seed).rand(self.samples, dimensions)
+        samples = 2 ** int(np.ceil(np.log2(max(self.samples, 2))))
+        return qmc.Sobol(dimensions, scramble=True, seed=self.seed).random(samples)[:self.samples]
+
+    def decode(self, unit):
+        choices = np.zeros((unit.shape[0], len(self.space.categorical_options)), dtype=int)
+        for column, index in enumerate(self.categorical_factors):
+            options = len(self.space.categorical_options[index])
+            choices[:, index] = np.minimum((unit[:, column] * options).astype(int), options - 1)
+        return self.space.decode(unit[:, len(self.categorical_factors):], choices)
+
+    def evaluate(self, inputs):
+        outputs = dict((key, np.zeros(inputs.shape[0])) for key in self.properties + ['loss'])
+        for start in range(0, inputs.shape[0], self.batch_size):
+            self.scan.checkCancelled()
+            start_time = time.perf_counter()
+            predictions = self.loss_engine.predict(inputs[start:start + self.batch_size], self.properties)
+            inference_time = time.perf_counter()
+            for key in self.properties:
+                outputs[key][start:start + self.batch_size] = predictions[key]
+            if self.scan.targets:
+                outputs['loss'][start:start + self.batch_size] = self.loss_engine.calculateLoss(predictions)
+            self.scan.timer.add('inference_time', inference_time - start_time)
+            self.scan.timer.add('loss_time', time.perf_counter() - inference_time)
+        if not self.scan.targets:
+            del outputs['loss']
+        return outputs
+
+    def sobolIndices(self):
+        dimensions = len(self.factors)
+        self.first_order = {}
+        self.total = {}
+        if dimensions == 0:
+            return self.first_order, self.total
+        unit = self.sampleUnit(2 * dimensions)
+        a, b = unit[:, :dimensions], unit[:, dimensions:]
+        ab = np.repeat(a[np.newaxis], dimensions, axis=0)
+        ab[np.arange(dimensions), :, np.arange(dimensions)] = b.T
+        matrix = np.vstack([a, b, ab.reshape(-1, dimensions)])
+        start_time = time.perf_counter()
+        inputs = self.decode(matrix).formatForInput()
+        self.scan.timer.add('sampling_time', time.perf_counter() - start_time)
+        outputs = self.evaluate(inputs)
+        size = unit.shape[0]
+        for key, values in outputs.items():
+            f_a, f_b = values[:size], values[size:2 * size]
+            f_ab = values[2 * size:].reshape(dimensions, size)
+            variance = np.var(np.concatenate([f_a, f_b]))
+            if variance <= 0:
+                self.first_order[key] = self.total[key] = np.zeros(dimensions)
+                continue
+            self.total[key] = 0.5 * np.mean((f_a - f_ab) ** 2, axis=1) / variance
+            first_order = (variance - 0.5 * np.mean((f_b - f_ab) ** 2, axis=1)) / variance
+            self.first_order[key] = np.clip(first_order, 0, self.total[key])
+        self.scan.evaluations += inputs.shape[0]
+        return self.first_order, self.total
+
+    def localJacobian(self, best_datapoint):
+        columns = list(self.space.varied)
+        self.jacobian = {}
+        if not columns:
+            return self.jacobian
+        centre = best_datapoint.range_based_values[0, columns]
+        upper = np.minimum(centre + self.step, self.space.upper[columns]) - centre
+        lower = centre - np.maximum(centre - self.step, self.space.lower[columns])
+        candidates = best_datapoint.repeat(2 * len(columns))
+        candidates.range_based_values[np.arange(len(columns)), columns] += upper
+        candidates.range_based_values[len(columns) + np.arange(len(columns)), columns] -= lower
+        outputs = self.evaluate(candidates.formatForInput())
+        for key, values in outputs.items():
+            self.jacobian[key] = (values[:len(columns)] - values[len(columns):]) / (upper + lower)
+        self.scan.evaluations += len(candidates)
+        return self.jacobian
+
+    def run(self, best_datapoint):
+        self.sobolIndices()
+        self.localJacobian(best_datapoint)
+        print('==========Sensitivity==========')
+        print('Sobol indices from %d evaluations over the configured ranges, derivatives per wt%% at the best composition' %
+              (self.samples * (len(self.factors) + 2)))
+        print('First order indices are clipped to between 0 and the total index to hide sampling noise')
+        varied = [self.space.range_based_keys[index] for index in self.space.varied]
+        for key in self.first_order.keys():
+            print(key)
+            order = np.argsort(-self.total[key])
+            for index in order:
+                factor = self.factors[index]
+                derivative = ''
+                if factor in varied:
+                    derivative = ', d/dx %f' % self.jacobian[key][varied.index(factor)]
+                print('  %s: first order %.3f, total %.3f%s' %
+                      (factor, self.first_order[key][index], self.total[key][index], derivative))
+        return self.first_order, self.total, self.jacobian
+
+    def exportCSV(self, output_path):
+        varied = [self.space.range_based_keys[index] for index in self.space.varied]
+        with open(output_path, 'w', newline='') as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow(['quantity', 'input', 'first_order', 'total', 'derivative'])
+            for key in self.first_order.keys():
+                for index, factor in enumerate(self.factors):
+                    derivative = '%g' % self.jacobian[key][varied.index(factor)] if factor in varied else ''
+                    writer.writerow([key, factor, '%g' % round(self.first_order[key][index], 4),
+                                     '%g' % round(self.total[key][index], 4), derivative])
+        print('Sensitivity indices saved to: ' + output_path)
@@ -1,29 +1,28 @@
 #!/usr/bin/python3
+import os
+import json
+import hashlib
 import numpy as np
-import csv
 import time
 import shutil
-from keras.activations import relu, linear
-from keras.models import Sequential
-from keras.layers import Dense, Dropout
-from talos.model import early_stopper
-from talos import Scan
-from matplotlib import pyplot as plt
 
 
 class modelTrainer:
-    def __init__(self, mode, plot=False, verbosity=1):
+    def __init__(self, mode, plot=False, verbosity=1, dataset_path=None, train=True):
         self.mode = mode
         self.plot = plot
         self.history = None
         self.best_model = None
         self.test_proportion = 0.20
         self.verbosity = verbosity
+        self.output_dim = 1
+        self.target_mean = 0
+        self.target_std = 1
         if self.mode == 'DoS':
             self.input_dim = 21
             self.dataset_path = 'training_datasets/DoS_dataset_1.csv'
-            self.params = {'activation1': [relu],
-                          'activation2': [relu],
+            self.params = {'activation1': ['relu'],
+                          'activation2': ['relu'],
                           'optimizer': ['Nadam'],
                           'losses': ['mean_absolute_error'],
                           'first_hidden_layer': [20],
@@ -34,8 +33,8 @@ class modelTrainer:
         elif self.mode == 'Elongation':
             self.input_dim = 26
             self.dataset_path = 'training_datasets/Mechanical_dataset_1.csv'
-            self.params = {'activation1': [relu],
-                          'activation2': [relu],
+            self.params = {'activation1': ['relu'],
+                          'activation2': ['relu'],
                           'optimizer': ['Nadam'],
                           'losses': ['mean_absolute_error'],
                           'first_hidden_layer': [25],
@@ -46,8 +45,8 @@ class modelTrainer:
         elif self.mode == 'Tensile':
             self.input_dim = 26
             self.dataset_path = 'training_datasets/Mechanical_dataset_1.csv'
-            self.params = {'activation1': [relu],
-                          'activation2': [relu],
+            self.params = {'activation1': ['relu'],
+                          'activation2': ['relu'],
                           'optimizer': ['Nadam'],
                           'losses': ['mean_absolute_error'],
                           'first_hidden_layer': [25],
@@ -58,8 +57,8 @@ class modelTrainer:
         elif self.mode == 'Yield':
             self.input_dim = 26
             self.dataset_path = 'training_datasets/Mechanical_dataset_1.csv'
-            self.params = {'activation1': [relu],
-                          'activation2': [relu],
+            self.params = {'activation1': ['relu'],
+                          'activation2': ['relu'],
                           'optimizer': ['Nadam'],
                           'losses': ['mean_absolute_error'],
                           'first_hidden_layer': [30],
@@ -67,40 +66,76 @@ class modelTrainer:
                           'dropout_probability': [0.2],
                           'batch_size': [8],
                           'epochs': [60]}
+        elif self.mode == 'Mechanical':
+            self.input_dim = 26
+            self.output_dim = 3
+            self.dataset_path = 'training_datasets/Mechanical_dataset_1.csv'
+            self.params = {'activation1': ['relu'],
+                          'activation2': ['relu'],
+                          'optimizer': ['Nadam'],
+                          'losses': ['mean_absolute_error'],
+                          'first_hidden_layer': [30],
+                          'second_hidden_layer': [30],
+                          'dropout_probability': [0.2],
+                          'batch_size': [8],
+                          'epochs': [200]}
         else:
             return
+        if dataset_path is not None:
+            self.dataset_path = dataset_path
+        self.cache_dir = None
         self.dataset = {}
         self.loadDataset(self.dataset_path)
-        self.run()
+        if train:
+            self.run()
+
+    def hashDataset(self, dataset_path):
+        digest = hashlib.sha256()
+        with open(dataset_path, 'rb') as dataset_file:
+            for block in iter(lambda: dataset_file.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()[:16]
+
+    def parseDataset(self, dataset_path):
+        try:
+            dataset = np.loadtxt(dataset_path, delimiter=',', skiprows=1, ndmin=2)
+        except ValueError:
+            dataset = np.genfromtxt(dataset_path, delimiter=',', skip_header=1, dtype=float, invalid_raise=False)
+        return np.atleast_2d(dataset)
+
+    def readDataset(self, dataset_path):
+        cache_dir = self.cache_dir or os.path.join(os.path.dirname(dataset_path), '.cache')
+        cache_path = os.path.join(cache_dir, '%s.%s.npy' % (os.path.basename(dataset_path), self.hashDataset(dataset_path)))
+        if os.path.isfile(cache_path):
+            return np.load(cache_path, mmap_mode='r')
+        dataset = self.parseDataset(dataset_path)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            temporary_path = cache_path + '.tmp.npy'
+            np.save(temporary_path, dataset)
+            os.replace(temporary_path, cache_path)
+        except OSError:
+            pass
+        return dataset
 
     def loadDataset(self, dataset_path):
-        dataset = []
-        with open(dataset_path, "r") as csv_file:
-            csv_reader = csv.reader(csv_file, delimiter=',')
-            next(csv_reader)
-            for lines in csv_reader:
-                dataset.append(lines)
-        dataset = np.asarray(dataset)
+        dataset = self.readDataset(dataset_path)
+        order = np.arange(dataset.shape[0])
         np.random.seed(2349138)
-        np.random.shuffle(dataset)
+        np.random.shuffle(order)
 
         if self.mode == 'Elongation':
-            dataset = np.delete(dataset, self.input_dim+2, 1)
-            dataset = np.delete(dataset, self.input_dim+1, 1)
+            columns = [*range(self.input_dim), self.input_dim]
         elif self.mode == 'Tensile':
-            dataset = np.delete(dataset, self.input_dim+2, 1)
-            dataset = np.delete(dataset, self.input_dim, 1)
+            columns = [*range(self.input_dim), self.input_dim+1]
         elif self.mode == 'Yield':
-            dataset = np.delete(dataset, self.input_dim+1, 1)
-            dataset = np.delete(dataset, self.input_dim, 1)
-
-        for row in reversed(range(dataset.shape[0])):
-            try:
-                for column in range((dataset.shape[1])):
-                    dataset[row][column] = float(dataset[row][column])
-            except Exception:
-                dataset = np.delete(dataset, row, 0)
-        dataset = dataset.astype(np.float)
+            columns = [*range(self.input_dim), self.input_dim+2]
+        elif self.mode == 'Mechanical':
+            columns = list(range(self.input_dim + self.output_dim))
+        else:
+            columns = list(range(dataset.shape[1]))
+        dataset = np.asarray(dataset[order][:, columns], dtype=float)
+        dataset = dataset[~np.isnan(dataset).any(axis=1)]
 
         self.dataset['full'] = dataset
         test_split = round(self.dataset['full'].shape[0]*self.test_proportion)
@@ -108,12 +143,22 @@ class modelTrainer:
         self.dataset['training'] = dataset[test_split:self.dataset['full'].shape[0], :]
 
     def activateTestSplit(self):
+        targets = slice(self.input_dim, self.input_dim + self.output_dim) if self.output_dim > 1 else self.input_dim
         self.dataset['X_train'] = self.dataset['training'][:, 0:self.input_dim]
-        self.dataset['Y_train'] = self.dataset['training'][:, self.input_dim]
+        self.dataset['Y_train'] = self.dataset['training'][:, targets]
         self.dataset['X_val'] = self.dataset['testing'][:, 0:self.input_dim]
-        self.dataset['Y_val'] = self.dataset['testing'][:, self.input_dim]
+        self.dataset['Y_val'] = self.dataset['testing'][:, targets]
+        if self.output_dim > 1:
+            self.target_mean = self.dataset['Y_train'].mean(axis=0)
+            self.target_std = np.maximum(self.dataset['Y_train'].std(axis=0), 1e-8)
+
+    def foldTargetScaling(self, model):
+        kernel, bias = model.layers[-1].get_weights()
+        model.layers[-1].set_weights([kernel * self.target_std, bias * self.target_std + self.target_mean])
 
     def model(self, X_train, Y_train, X_val, Y_val, params):
+        from keras.models import Sequential
+        from keras.layers import Dense, Dropout
         model = Sequential()
         model.add(Dense(params['first_hidden_layer'],
                         input_dim=self.input_dim,
@@ -124,35 +169,37 @@ class modelTrainer:
                         activation=params['activation2'],
                         use_bias=True))
         model.add(Dropout(params['dropout_probability']))
-        model.add(Dense(1, activation=linear))
+        model.add(Dense(self.output_dim, activation='linear'))
 
         model.compile(optimizer=params['optimizer'],
                       loss=params['losses'])
 
         history = model.fit(self.dataset['X_train'],
-                            self.dataset['Y_train'],
+                            (self.dataset['Y_train'] - self.target_mean) / self.target_std,
                             batch_size=params['batch_size'],
                             epochs=params['epochs'],
                             verbose=self.verbosity,
-                            validation_data=[self.dataset['X_val'], self.dataset['Y_val']]
+                            validation_data=[self.dataset['X_val'], (self.dataset['Y_val'] - self.target_mean) / self.target_std]
                             )
-        self.history = history
+        if self.output_dim > 1:
+            self.foldTargetScaling(model)
+        self.history = history.history
         return history, model
 
-    def run(self):
+    def run(self, processes=None, threads_per_worker=1, trials=None, reduction_factor=3, seed=0, ensemble_size=1,
+            bootstrap=False):
+        from src.HyperparameterSearch import hyperparameterSearch
         self.activateTestSplit()
 
-        self.best_model = Scan(self.dataset['X_train'],
-                            self.dataset['Y_train'],
-                            model=self.model,
-                            params=self.params,
-                            print_params=True,
-                            experiment_name=self.mode + '_model',
-                            reduction_metric='val_loss').best_model(metric='val_loss', asc=True)
+        search = hyperparameterSearch(self, trials=trials, processes=processes, threads_per_worker=threads_per_worker,
+                                      reduction_factor=reduction_factor, seed=seed)
+        best = search.run()
+        self.history = best['history']
 
         if self.plot:
-            plt.plot(np.log(self.history.history['loss'])/np.log(40))
-            plt.plot(np.log(self.history.history['val_loss'])/np.log(40))
+            from matplotlib import pyplot as plt
+            plt.plot(np.log(self.history['loss'])/np.log(40))
+            plt.plot(np.log(self.history['val_loss'])/np.log(40))
             plt.title(self.mode + ' Training Results')
             plt.ylabel('Log(40) Linear Loss')
             plt.xlabel('Epoch')
@@ -162,8 +209,38 @@ class modelTrainer:
         print('Model trained on ', self.dataset['X_train'].shape[0], ' samples, verified on ',
               self.dataset['X_val'].shape[0], ' samples')
 
-        shutil.rmtree(self.mode + '_model')
+        if ensemble_size > 1:
+            self.best_model = self.saveEnsemble(search, best['params'], ensemble_size, bootstrap)
+            return
 
         model_path = 'models/' + self.mode + '_model' + '_' + str(int(round(time.time() * 1000))) + '.h5'
-        self.best_model.save(model_path)
+        shutil.copyfile(best['model_path'], model_path)
+        self.best_model = model_path
         print('Model saved to: ' + model_path)
+
+    def saveEnsemble(self, search, params, ensemble_size, bootstrap):
+        name = self.mode + '_ensemble' + '_' + str(int(round(time.time() * 1000)))
+        members = ['%s_member_%d.h5' % (name, index) for index in range(ensemble_size)]
+        search.trainEnsemble(params, ['models/' + member for member in members], bootstrap)
+        manifest_path = 'models/' + name + '.json'
+        with open(manifest_path, 'w') as manifest_file:
+            json.dump({'mode': self.mode, 'members': members, 'bootstrap': bootstrap, 'params': params},
+                      manifest_file, indent=2)
+        print('Ensemble saved to: ' + manifest_path)
+        return manifest_path
+
+def compareMechanicalModels(multi_output_path, single_output_paths, dataset_path=None):
+    from src.ModelRegistry import loadModel
+    trainer = modelTrainer('Mechanical', dataset_path=dataset_path, train=False)
+    trainer.activateTestSplit()
+    X_val = trainer.dataset['X_val']
+    Y_val = trainer.dataset['Y_val']
+    multi_output = np.reshape(loadModel(multi_output_path).predict(X_val), (X_val.shape[0], -1))
+    results = {}
+    print('Mean absolute error on ', X_val.shape[0], ' validation samples')
+    for column, key in enumerate(['elongation', 'tensile', 'yield']):
+        single_output = np.ravel(loadModel(single_output_paths[key]).predict(X_val))
+        results[key] = (np.mean(np.abs(multi_output[:, column] - Y_val[:, column])),
+                        np.mean(np.abs(single_output - Y_val[:, column])))
+        print('%s: multi-output %f, single-output %f' % (key, results[key][0], results[key][1]))
+    return results
@@ -0,0 +1,8 @@
+#!/usr/bin/python3
+import time
+start_time = time.perf_counter()
+
+from src.Headless import main
+
+if __name__ == '__main__':
+    main(started=start_time)
@@ -0,0 +1,11 @@
+import os
+import sys
+
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+@pytest.fixture(autouse=True)
+def repositoryRoot(monkeypatch):
+    monkeypatch.chdir(root)
@@ -0,0 +1,38 @@
+import csv
+import contextlib
+import io
+
+import pytest
+
+from src.ModelRegistry import registry, default_model_paths
+from src.PredictOutput import predictOutput
+
+template_path = 'prediction_datasets/Mechanical/Template.csv'
+
+def writeDataset(path, extra_lines):
+    with open(template_path, 'r') as template_file:
+        lines = template_file.read().splitlines()
+    with open(path, 'w') as dataset_file:
+        dataset_file.write('\n'.join([lines[0], lines[1], '', lines[1]] + extra_lines) + '\n')
+
+def runPredict(dataset_path, output_path):
+    job = predictOutput(dataset_path, registry.getModels(default_model_paths, 'Mechanical'), 'Mechanical',
+                        output_path, chunk_size=1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        job.run()
+
+def test_blank_lines_are_skipped(tmp_path):
+    dataset_path, output_path = str(tmp_path / 'dataset.csv'), str(tmp_path / 'predictions.csv')
+    writeDataset(dataset_path, ['', ''])
+    runPredict(dataset_path, output_path)
+    with open(output_path, newline='') as output_file:
+        output = list(csv.reader(output_file))
+    assert [row[0] for row in output[1:]] == ['0', '1']
+
+def test_invalid_row_names_its_line(tmp_path):
+    dataset_path, output_path = str(tmp_path / 'dataset.csv'), str(tmp_path / 'predictions.csv')
+    writeDataset(dataset_path, ['10,abc'])
+    with pytest.raises(ValueError, match='line 5'):
+        runPredict(dataset_path, output_path)
+    assert not (tmp_path / 'predictions.csv').exists()
+    assert not (tmp_path / 'predictions.csv.tmp').exists()
@@ -0,0 +1,40 @@
+import csv
+import contextlib
+import io
+
+import numpy as np
+
+from src.CompositionScan import scanSettings
+from src.ModelRegistry import registry, default_model_paths
+from src.ScreeningScan import screeningScan
+
+def runScreen(output_path, **options):
+    settings = scanSettings('Mechanical')
+    scan = screeningScan(settings, registry.getModels(default_model_paths, settings.mode), seed=0,
+                         model_paths=default_model_paths, **options)
+    with contextlib.redirect_stdout(io.StringIO()):
+        scan.search()
+        scan.exportCSV(output_path)
+    return scan
+
+def test_exported_rows_are_unique(tmp_path):
+    output_path = str(tmp_path / 'screen.csv')
+    scan = runScreen(output_path, samples=20000, chunk_size=5000, top=100)
+    with open(output_path, newline='') as output_file:
+        reader = csv.reader(output_file)
+        header = next(reader)
+        inputs = [tuple(row[:header.index('Al%') + 1 + len(scan.space.range_based_keys)]) for row in reader]
+    assert len(inputs) == 100
+    assert len(set(inputs)) == len(inputs)
+
+def test_latin_hypercube_is_stratified_over_all_chunks(tmp_path):
+    scan = runScreen(str(tmp_path / 'screen.csv'), samples=1000, chunk_size=100, top=10)
+    unit = np.vstack([scan.sampleUnit(start, stop) for start, stop in scan.getChunks()])
+    strata = np.sort((unit * scan.samples).astype(int), axis=0)
+    assert (strata == np.arange(scan.samples)[:, np.newaxis]).all()
+
+def test_histograms_count_every_candidate(tmp_path):
+    scan = runScreen(str(tmp_path / 'screen.csv'), samples=5000, chunk_size=500, top=10)
+    for counts, edges in scan.histograms.values():
+        assert counts.sum() == scan.evaluations
+        assert len(edges) == scan.histogram_bins + 3